@@ -1,8 +1,10 @@
+import os
+import numpy as np
 import torch
 from torch.utils.data import DataLoader
 
 
-def flatten(dataloader: DataLoader):
+def flatten(dataloader: DataLoader, out_dir: str = None):
     """
     Combines batches from a DataLoader into a single tensor. If
     there are multiple tensors returned in each batch, they will be
@@ -13,12 +15,21 @@ def flatten(dataloader: DataLoader):
     this function will return a tuple of two tensors of shapes
     (N*M)xD and (N*M)x1 where M is the number of batches.
 
-    :param dataloader: The DataLoader to flatten.
+    The output tensors are preallocated based on the number of samples the
+    DataLoader will produce (or a probe of the first batch), and each batch
+    is copied into them in place.
+
+    :param dataloader: The DataLoader to flatten. Its batches must contain
+        dense (strided) tensors; a ValueError is raised for sparse ones.
+    :param out_dir: Optional directory in which to create memory-mapped .npy
+        files backing the output tensors, for data larger than RAM. Existing
+        files named flatten-<i>.npy in it will be overwritten.
     :return: A tuple of one or more tensors containing the data from all
         batches.
     """
 
-    out_tensors_cache = []
+    out_tensors = None
+    offsets = None
 
     for batch in dataloader:
 
@@ -31,16 +42,78 @@ def flatten(dataloader: DataLoader):
         elif not isinstance(batch, tuple) and not isinstance(batch, list):
             raise TypeError("Unexpected type of batch object")
 
+        if out_tensors is None:
+            if any(tensor.layout != torch.strided for tensor in batch):
+                raise ValueError("Can't flatten batches of sparse tensors")
+            num_samples = _max_num_samples(dataloader, len(batch[0]))
+            out_tensors = [
+                _allocate(tensor, num_samples, out_dir, i)
+                for i, tensor in enumerate(batch)
+            ]
+            offsets = [0] * len(batch)
+
         for i, tensor in enumerate(batch):
-            if i >= len(out_tensors_cache):
-                out_tensors_cache.append([])
+            start, end = offsets[i], offsets[i] + len(tensor)
+            if end > len(out_tensors[i]):
+                if out_dir is not None:
+                    raise ValueError("DataLoader produced more samples than expected")
+                # Unknown or underestimated size, grow geometrically
+                grown = _allocate(tensor, max(end, 2 * len(out_tensors[i])), None, i)
+                grown[:start] = out_tensors[i][:start]
+                out_tensors[i] = grown
 
-            out_tensors_cache[i].append(tensor)
+            # 0 is batch dimension
+            out_tensors[i][start:end] = tensor
+            offsets[i] = end
 
-    out_tensors = tuple(
-        # 0 is batch dimension
-        torch.cat(tensors_list, dim=0)
-        for tensors_list in out_tensors_cache
-    )
+    if out_tensors is None:
+        return ()
+
+    return tuple(out[:offset] for out, offset in zip(out_tensors, offsets))
+
+
+def _max_num_samples(dataloader: DataLoader, first_batch_len: int):
+    """
+    :return: An upper bound on the number of samples a DataLoader produces,
+        or None if it can't be determined.
+    """
+    if dataloader.batch_size is not None:
+        try:
+            # Accounts for samplers which only cover part of the dataset
+            return len(dataloader.sampler)
+        except TypeError:
+            return None
 
-    return out_tensors
+    # A custom batch sampler, whose batches may differ in size
+    try:
+        return len(dataloader.dataset)
+    except TypeError:
+        pass
+    try:
+        return len(dataloader) * first_batch_len
+    except TypeError:
+        return None
+
+
+def _allocate(like: torch.Tensor, num_samples, out_dir, index):
+    """
+    Allocates a tensor for num_samples samples shaped like the samples of
+    a given batch, optionally backed by a memory-mapped file.
+    """
+    if num_samples is None:
+        if out_dir is not None:
+            raise ValueError("Can't determine number of samples for memory-mapping")
+        num_samples = len(like)
+
+    shape = (num_samples, *like.shape[1:])
+    if out_dir is None:
+        return torch.empty(shape, dtype=like.dtype, device=like.device)
+
+    os.makedirs(out_dir, exist_ok=True)
+    mm = np.lib.format.open_memmap(
+        os.path.join(out_dir, f"flatten-{index}.npy"),
+        mode="w+",
+        dtype=like.numpy().dtype,
+        shape=shape,
+    )
+    return torch.from_numpy(mm)
@@ -0,0 +1,270 @@
+import os
+import enum
+import json
+import types
+import hashlib
+import functools
+import numpy as np
+import torch
+from typing import Tuple
+from torch.utils.data import Dataset, DataLoader
+
+_PRIMITIVE_TYPES = (int, float, str, bool, type(None))
+_TRANSFORM_ATTRS = ("transform", "target_transform", "transforms")
+_CALLABLE_TYPES = (
+    types.FunctionType,
+    types.BuiltinFunctionType,
+    types.MethodType,
+    functools.partial,
+    type,
+)
+
+
+def dataset_fingerprint(dataset: Dataset, config: dict = None) -> str:
+    """
+    Computes a content hash identifying a dataset's configuration.
+
+    :param dataset: The dataset to fingerprint.
+    :param config: A dict fully describing the dataset. If None, a config is
+        built from the dataset class, its length and its attributes:
+        primitives and containers of them by value, tensors and arrays by a
+        hash of their contents and nested datasets recursively. Transforms
+        (and objects nested in them) are described by their class and public
+        attributes, and nn.Module transforms also by their state and
+        submodules. A ValueError is raised if the dataset has any other
+        attribute, or a transform which is a function (or holds one, like
+        torchvision's Lambda), in which case a config must be given.
+    :return: A hex string key for the dataset.
+    """
+    if config is None:
+        config = _dataset_config(dataset)
+
+    config_str = json.dumps(config, sort_keys=True, default=repr)
+    return hashlib.sha256(config_str.encode("utf-8")).hexdigest()[:16]
+
+
+def _dataset_config(dataset: Dataset) -> dict:
+    config = dict(cls=type(dataset).__qualname__, len=len(dataset))
+    for name, value in vars(dataset).items():
+        config[name] = _attr_config(
+            type(dataset), name, value, objects=name in _TRANSFORM_ATTRS
+        )
+    return config
+
+
+def _attr_config(cls, name, value, objects=False):
+    if isinstance(value, _PRIMITIVE_TYPES):
+        return value
+    if isinstance(value, os.PathLike):
+        return os.fspath(value)
+    if isinstance(value, (tuple, list)):
+        return [_attr_config(cls, name, v, objects) for v in value]
+    if isinstance(value, dict):
+        return [[_attr_config(cls, name, k), _attr_config(cls, name, v, objects)]
+                for k, v in value.items()]
+    if isinstance(value, enum.Enum):
+        return f"{type(value).__qualname__}.{value.name}"
+    if isinstance(value, torch.Tensor):
+        data = value.detach().cpu().contiguous().reshape(-1).view(torch.uint8)
+        return dict(
+            dtype=str(value.dtype),
+            shape=list(value.shape),
+            sha256=hashlib.sha256(data.numpy()).hexdigest(),
+        )
+    if isinstance(value, np.ndarray):
+        data = np.ascontiguousarray(value).reshape(-1).view(np.uint8)
+        return dict(
+            dtype=value.dtype.str,
+            shape=list(value.shape),
+            sha256=hashlib.sha256(data).hexdigest(),
+        )
+    if isinstance(value, Dataset):
+        return _dataset_config(value)
+    if objects and hasattr(value, "__dict__") and not isinstance(value, _CALLABLE_TYPES):
+        return _object_config(cls, name, value)
+    raise ValueError(
+        f"Can't fingerprint attribute {cls.__qualname__}.{name} of type "
+        f"{type(value).__qualname__}, pass an explicit config"
+    )
+
+
+def _object_config(cls, name, value) -> dict:
+    # Private attributes are taken to be runtime state, e.g. reused buffers
+    value_cls = type(value)
+    config = dict(cls=f"{value_cls.__module__}.{value_cls.__qualname__}")
+    for attr, attr_value in vars(value).items():
+        if not attr.startswith("_"):
+            config[attr] = _attr_config(cls, name, attr_value, objects=True)
+    if isinstance(value, torch.nn.Module):
+        config["modules"] = [
+            [child_name, _object_config(cls, name, child)]
+            for child_name, child in value.named_children()
+        ]
+        config["state"] = [
+            [key, _attr_config(cls, name, tensor)]
+            for key, tensor in value.state_dict().items()
+        ]
+    return config
+
+
+class MemmapDataset(Dataset):
+    """
+    A dataset of (sample, label) pairs served from .npy memory-mapped files.
+    """
+
+    def __init__(self, samples_path: str, labels_path: str, scale=1):
+        """
+        :param samples_path: Path of a .npy file with samples, shape (N, ...).
+        :param labels_path: Path of a .npy file with labels, shape (N,).
+        :param scale: The factor samples were multiplied by when stored. If
+            not 1, samples are served as float32 divided by it (so they are
+            copies, not views of the files).
+        """
+        self.scale = scale
+        # Copy-on-write mode: tensors wrapping the maps are writable without
+        # ever modifying the files.
+        self.samples = np.load(samples_path, mmap_mode="c")
+        self.labels = np.load(labels_path, mmap_mode="c")
+        if len(self.samples) != len(self.labels):
+            raise ValueError("Samples and labels lengths don't match")
+
+    def __getitem__(self, index) -> Tuple[torch.Tensor, int]:
+        if index < 0 or index >= len(self):
+            raise IndexError()
+        return self._unscale(self.samples[index]), int(self.labels[index])
+
+    def get_batch(self, indices) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        Returns a batch of samples and labels.
+        :param indices: A slice or a sequence of indices. A slice is served
+            as a zero-copy view of the underlying files (unless scaled).
+        :return: A tuple of tensors (samples, labels).
+        """
+        if not isinstance(indices, slice):
+            indices = np.asarray(indices, dtype=np.int64)
+        return (
+            self._unscale(self.samples[indices]),
+            torch.from_numpy(self.labels[indices]),
+        )
+
+    def _unscale(self, samples: np.ndarray) -> torch.Tensor:
+        samples = torch.from_numpy(samples)
+        if self.scale != 1:
+            samples = samples.float().div_(self.scale)
+        return samples
+
+    def __getitems__(self, indices):
+        samples, labels = self.get_batch(indices)
+        return list(zip(samples, labels.tolist()))
+
+    def __len__(self):
+        return len(self.samples)
+
+
+def cached_dataset(
+    dataset: Dataset,
+    cache_dir: str,
+    config: dict = None,
+    dtype=None,
+    scale=1,
+    batch_size=256,
+    num_workers=0,
+) -> MemmapDataset:
+    """
+    Materializes a map-style dataset of (sample, label) pairs into memory-mapped
+    .npy files, or loads them if they were already created for the same
+    dataset configuration.
+
+    :param dataset: The dataset to materialize. Samples must be tensors of the
+        same shape and labels must be integers.
+    :param cache_dir: Directory to store the cache files in.
+    :param config: A dict fully describing the dataset, used to compute the
+        cache key. See dataset_fingerprint().
+    :param dtype: numpy dtype to store samples as, e.g. np.uint8 or np.float16
+        for a compact cache. If None, the dtype of the samples is kept.
+        Floating point samples are only stored as an integer dtype if they can
+        be restored exactly, otherwise a ValueError is raised.
+    :param scale: Factor to multiply samples by before storing them, and to
+        divide them by when served. E.g. use dtype=np.uint8 and scale=255 for
+        images converted to [0,1] floats by ToTensor().
+    :param batch_size: Number of samples to load at a time when materializing.
+    :param num_workers: Number of DataLoader workers used when materializing.
+    :return: A MemmapDataset serving the cached samples.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    key = dataset_fingerprint(dataset, config)
+    if dtype is not None:
+        key = f"{key}-{np.dtype(dtype).name}"
+    if scale != 1:
+        key = f"{key}-x{scale}"
+    samples_path = os.path.join(cache_dir, f"{key}-samples.npy")
+    labels_path = os.path.join(cache_dir, f"{key}-labels.npy")
+
+    # The labels file is renamed into place last, so it marks a complete cache.
+    if os.path.isfile(samples_path) and os.path.isfile(labels_path):
+        return MemmapDataset(samples_path, labels_path, scale)
+
+    n = len(dataset)
+    sample0, _ = dataset[0]
+    sample0 = np.asarray(sample0)
+    samples_tmp_path = f"{samples_path}.tmp.npy"
+    labels_tmp_path = f"{labels_path}.tmp.npy"
+    samples = np.lib.format.open_memmap(
+        samples_tmp_path,
+        mode="w+",
+        dtype=sample0.dtype if dtype is None else dtype,
+        shape=(n, *sample0.shape),
+    )
+    labels = np.lib.format.open_memmap(
+        labels_tmp_path, mode="w+", dtype=np.int64, shape=(n,)
+    )
+
+    dl = DataLoader(dataset, batch_size=batch_size, num_workers=num_workers)
+    start = 0
+    try:
+        for x, y in dl:
+            end = start + len(x)
+            samples[start:end] = _quantize(x, samples.dtype, scale)
+            labels[start:end] = y.numpy()
+            start = end
+    except BaseException:
+        del samples, labels
+        os.remove(samples_tmp_path)
+        os.remove(labels_tmp_path)
+        raise
+
+    samples.flush()
+    labels.flush()
+    del samples, labels
+    os.replace(samples_tmp_path, samples_path)
+    os.replace(labels_tmp_path, labels_path)
+
+    return MemmapDataset(samples_path, labels_path, scale)
+
+
+def _quantize(x: torch.Tensor, dtype: np.dtype, scale) -> np.ndarray:
+    """
+    Converts a batch of samples to the dtype they're stored as, multiplied by
+    the scale. Raises a ValueError if floating point samples can't be restored
+    exactly from an integer dtype.
+    """
+    if scale != 1:
+        x_scaled = x.double() * scale
+    else:
+        x_scaled = x
+    if not (np.issubdtype(dtype, np.integer) and x.is_floating_point()):
+        return x_scaled.numpy()
+
+    info = np.iinfo(dtype)
+    stored = x_scaled.round()
+    restored = stored if scale == 1 else stored.float().div_(scale)
+    if (
+        stored.min() < info.min
+        or stored.max() > info.max
+        or not torch.equal(restored.to(x.dtype), x)
+    ):
+        raise ValueError(
+            f"Samples can't be stored losslessly as {np.dtype(dtype).name}"
+            f" with scale={scale}"
+        )
+    return stored.numpy()
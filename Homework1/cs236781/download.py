@@ -1,23 +1,64 @@
 import os
+import re
+import json
 import shutil
-import urllib
+import hashlib
 import pathlib
 import tarfile
 import zipfile
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
 
+_CHUNK_SIZE = 1 << 20
+_CONTENT_RANGE_RE = re.compile(r"bytes (\d+)-(\d+)/(\d+|\*)")
+_UNSATISFIED_RANGE_RE = re.compile(r"bytes \*/(\d+)")
 
-def download_data(out_path, url, extract=True, force=False):
+
+def download_data(
+    out_path, url, extract=True, force=False, sha256=None, num_parts=1
+):
+    """
+    Downloads a file from a URL and optionally extracts it.
+
+    The file is downloaded into a temporary file next to the output file and
+    only renamed to its final name once complete (and verified, if a checksum
+    is given), so an existing output file is always a complete download.
+    An interrupted download is resumed with HTTP Range requests on the next
+    call, if the server supports them and identifies the file's version (by
+    ETag or Last-Modified). It starts over if the remote file changed.
+
+    :param out_path: Directory to save the file to.
+    :param url: URL to download.
+    :param extract: Whether to extract the file if it's a zip or tar archive.
+    :param force: Whether to download the file even if it already exists.
+    :param sha256: Expected SHA-256 hex digest of the file. If given, the
+        download is verified against it and an existing file which doesn't
+        match is downloaded again.
+    :param num_parts: Number of byte ranges to download in parallel. Falls
+        back to a single range if the server doesn't report the file size or
+        doesn't support Range requests.
+    :return: A tuple of the downloaded file's path and the directory it was
+        extracted to (or None).
+    """
     pathlib.Path(out_path).mkdir(exist_ok=True)
     out_filename = os.path.join(out_path, os.path.basename(url))
 
-    if os.path.isfile(out_filename) and not force:
+    if os.path.isfile(out_filename) and not force and _verify(out_filename, sha256):
         print(f"File {out_filename} exists, skipping download.")
     else:
         print(f"Downloading {url}...")
 
-        with urllib.request.urlopen(url) as response:
-            with open(out_filename, "wb") as out_file:
-                shutil.copyfileobj(response, out_file)
+        tmp_filename = f"{out_filename}.part"
+        if force:
+            _remove_parts(tmp_filename)
+        _download(url, tmp_filename, num_parts)
+
+        if not _verify(tmp_filename, sha256):
+            _remove_parts(tmp_filename)
+            raise ValueError(f"SHA-256 mismatch for downloaded file {url}")
+        os.replace(tmp_filename, out_filename)
+        _remove_parts(tmp_filename)
 
         print(f"Saved to {out_filename}.")
 
@@ -25,22 +66,292 @@ def download_data(out_path, url, extract=True, force=False):
     if extract and out_filename.endswith(".zip"):
         print(f"Extracting {out_filename}...")
         with zipfile.ZipFile(out_filename, "r") as zipf:
-            names = zipf.namelist()
-            zipf.extractall(out_path)
             zipinfos = zipf.infolist()
+            members = {
+                zi.filename: dict(size=zi.file_size, crc=zi.CRC, dir=zi.is_dir())
+                for zi in zipinfos
+            }
+            n_extracted = _extract_incremental(
+                out_filename, out_path, members, _zip_extractor(zipf, out_path)
+            )
             first_dir = next(filter(lambda zi: zi.is_dir(), zipinfos)).filename
             extracted_dir = os.path.join(out_path, os.path.dirname(first_dir))
-            print(f"Extracted {len(names)} to {extracted_dir}")
-            retval = extracted_dir
+            print(f"Extracted {n_extracted} of {len(zipinfos)} to {extracted_dir}")
 
     if extract and out_filename.endswith((".tar.gz", ".tgz")):
         print(f"Extracting {out_filename}...")
         with tarfile.open(out_filename, "r") as tarf:
-            members = tarf.getmembers()
-            tarf.extractall(out_path)
-            first_dir = next(filter(lambda ti: ti.isdir(), members)).name
+            tarinfos = tarf.getmembers()
+            members = {
+                ti.name: dict(size=ti.size, mtime=ti.mtime, dir=ti.isdir())
+                for ti in tarinfos
+            }
+            n_extracted = _extract_incremental(
+                out_filename, out_path, members, _tar_extractor(tarf, out_path)
+            )
+            first_dir = next(filter(lambda ti: ti.isdir(), tarinfos)).name
             extracted_dir = os.path.join(out_path, os.path.dirname(first_dir))
-            print(f"Extracted {len(members)} to {extracted_dir}")
-            retval = extracted_dir
+            print(f"Extracted {n_extracted} of {len(tarinfos)} to {extracted_dir}")
 
     return out_filename, extracted_dir
+
+
+def _extract_incremental(archive_filename, out_path, members, extractor):
+    """
+    Extracts the members of an archive which aren't already on disk as
+    recorded by the archive's manifest, then updates the manifest.
+    :param archive_filename: Path of the archive.
+    :param out_path: Directory to extract to.
+    :param members: Dict from member name to a dict describing it (size and
+        CRC or mtime), as recorded in the manifest.
+    :param extractor: Callable which extracts a list of member names.
+    :return: The number of members extracted.
+    """
+    manifest_filename = f"{archive_filename}.manifest.json"
+    stat = os.stat(archive_filename)
+    archive = dict(size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+
+    extracted = {}
+    if os.path.isfile(manifest_filename):
+        with open(manifest_filename, "r") as f:
+            manifest = json.load(f)
+        if manifest.get("archive") == archive:
+            extracted = manifest["members"]
+
+    names = [
+        name
+        for name, member in members.items()
+        if extracted.get(name) != member
+        or not _is_extracted(os.path.join(out_path, name), member)
+    ]
+    if names:
+        extractor(names)
+
+    # Written last and atomically, so an interrupted extraction is redone
+    tmp_filename = f"{manifest_filename}.tmp"
+    with open(tmp_filename, "w") as f:
+        json.dump(dict(archive=archive, members=members), f)
+    os.replace(tmp_filename, manifest_filename)
+    return len(names)
+
+
+def _is_extracted(path, member):
+    if member["dir"]:
+        return os.path.isdir(path)
+    return os.path.isfile(path) and os.path.getsize(path) == member["size"]
+
+
+def _zip_extractor(zipf: zipfile.ZipFile, out_path, max_workers=None):
+    def extract(names):
+        # Directories are created up front, since concurrent extraction of
+        # members sharing a new parent directory would race on creating it.
+        files = []
+        for name in names:
+            if name.endswith("/"):
+                zipf.extract(name, out_path)
+            else:
+                parent = os.path.dirname(name)
+                if parent:
+                    os.makedirs(os.path.join(out_path, parent), exist_ok=True)
+                files.append(name)
+
+        # Members are decompressed concurrently; zlib releases the GIL.
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            for _ in pool.map(lambda name: zipf.extract(name, out_path), files):
+                pass
+
+    return extract
+
+
+def _tar_extractor(tarf: tarfile.TarFile, out_path):
+    def extract(names):
+        names = set(names)
+        tarf.extractall(out_path, members=[m for m in tarf if m.name in names])
+
+    return extract
+
+
+def _verify(filename, sha256):
+    if sha256 is None:
+        return True
+    h = hashlib.sha256()
+    with open(filename, "rb") as f:
+        for chunk in iter(lambda: f.read(_CHUNK_SIZE), b""):
+            h.update(chunk)
+    return h.hexdigest() == sha256.lower()
+
+
+def _remove_parts(tmp_filename):
+    tmp_dir, tmp_basename = os.path.split(tmp_filename)
+    for name in os.listdir(tmp_dir or "."):
+        if name.startswith(tmp_basename):
+            os.remove(os.path.join(tmp_dir, name))
+
+
+def _download(url, tmp_filename, num_parts):
+    """
+    Downloads a URL into a temporary file, resuming from any partial files
+    left by a previous attempt of the same version of the remote file.
+    """
+    validator_filename = f"{tmp_filename}.validator"
+    size, validator = _remote_info(url) if num_parts > 1 else (None, None)
+    if size is None or size < num_parts:
+        _download_stream(url, tmp_filename, validator_filename)
+        return
+
+    # Parts of a different (or unknown) version of the file can't be reused
+    if validator is None or _read_validator(validator_filename) != validator:
+        _remove_parts(tmp_filename)
+        if validator is not None:
+            _write_validator(validator_filename, validator)
+
+    # Each range goes to its own file so that each can be resumed separately
+    bounds = [size * i // num_parts for i in range(num_parts + 1)]
+    part_filenames = [
+        f"{tmp_filename}.{start}-{end}" for start, end in zip(bounds[:-1], bounds[1:])
+    ]
+    with ThreadPoolExecutor(max_workers=num_parts) as pool:
+        futures = [
+            pool.submit(_download_part, url, part_filename, start, end, validator)
+            for part_filename, start, end in zip(
+                part_filenames, bounds[:-1], bounds[1:]
+            )
+        ]
+        for future in futures:
+            future.result()
+
+    with open(tmp_filename, "wb") as out_file:
+        for part_filename in part_filenames:
+            with open(part_filename, "rb") as part_file:
+                shutil.copyfileobj(part_file, out_file, _CHUNK_SIZE)
+    for part_filename in part_filenames:
+        os.remove(part_filename)
+
+
+def _remote_info(url):
+    """
+    :return: A tuple of the size of the file at the URL if the server
+        supports Range requests for it (otherwise None), and its validator
+        (see _response_validator()).
+    """
+    request = urllib.request.Request(url, headers={"Range": "bytes=0-0"})
+    with urllib.request.urlopen(request) as response:
+        match = _CONTENT_RANGE_RE.fullmatch(response.headers.get("Content-Range", ""))
+        if response.status != 206 or match is None or match.group(3) == "*":
+            return None, None
+        return int(match.group(3)), _response_validator(response)
+
+
+def _response_validator(response):
+    """
+    :return: A value identifying the version of the file sent in a response,
+        which can be sent in an If-Range header: a strong ETag or otherwise
+        the Last-Modified date. None if the response has neither.
+    """
+    etag = response.headers.get("ETag")
+    if etag and not etag.startswith("W/"):
+        return etag
+    return response.headers.get("Last-Modified")
+
+
+def _read_validator(validator_filename):
+    if not os.path.isfile(validator_filename):
+        return None
+    with open(validator_filename, "r") as f:
+        return f.read() or None
+
+
+def _write_validator(validator_filename, validator):
+    with open(validator_filename, "w") as f:
+        f.write(validator)
+
+
+def _download_part(url, filename, start, end, validator):
+    """
+    Downloads the bytes [start, end) of a URL into a file, appending to the
+    bytes of a previous attempt already in it. If a validator is given, the
+    server only sends the range if the file still has it, and an IOError is
+    raised if it doesn't.
+    """
+    offset = start + (os.path.getsize(filename) if os.path.isfile(filename) else 0)
+    if offset >= end:
+        return
+
+    headers = {"Range": f"bytes={offset}-{end - 1}"}
+    if validator is not None:
+        headers["If-Range"] = validator
+    request = urllib.request.Request(url, headers=headers)
+
+    with urllib.request.urlopen(request) as response:
+        if response.status != 206:
+            raise IOError(f"{url} changed during download")
+        _check_content_range(url, response, offset)
+        with open(filename, "ab") as out_file:
+            _copy_response(url, response, out_file)
+
+
+def _download_stream(url, filename, validator_filename):
+    """
+    Downloads a URL into a file, resuming from the bytes a previous attempt
+    wrote to it if the server supports Range requests and the file at the URL
+    is still the same version, according to the validator stored with it.
+    Otherwise the download starts over.
+    """
+    offset = os.path.getsize(filename) if os.path.isfile(filename) else 0
+    validator = _read_validator(validator_filename)
+    if offset > 0 and validator is None:
+        # Can't tell whether the remote file changed since
+        offset = 0
+
+    headers = {}
+    if offset > 0:
+        headers["Range"] = f"bytes={offset}-"
+        headers["If-Range"] = validator
+    request = urllib.request.Request(url, headers=headers)
+
+    try:
+        response = urllib.request.urlopen(request)
+    except urllib.error.HTTPError as e:
+        if e.code != 416 or offset == 0:
+            raise
+        # The file was already complete, only not yet renamed, if it has the
+        # size of the remote file. Otherwise it's stale.
+        match = _UNSATISFIED_RANGE_RE.fullmatch(e.headers.get("Content-Range", ""))
+        if match is not None and int(match.group(1)) == offset:
+            return
+        os.remove(filename)
+        return _download_stream(url, filename, validator_filename)
+
+    with response:
+        if offset > 0 and response.status == 206:
+            _check_content_range(url, response, offset)
+            mode = "ab"
+        else:
+            # A new download, or the server sent the whole (possibly changed)
+            # file instead of the range
+            mode = "wb"
+            validator = _response_validator(response)
+            if validator is not None:
+                _write_validator(validator_filename, validator)
+            elif os.path.isfile(validator_filename):
+                os.remove(validator_filename)
+
+        with open(filename, mode) as out_file:
+            _copy_response(url, response, out_file)
+
+
+def _check_content_range(url, response, offset):
+    match = _CONTENT_RANGE_RE.fullmatch(response.headers.get("Content-Range", ""))
+    if match is None or int(match.group(1)) != offset:
+        raise IOError(f"Unexpected Content-Range from {url}")
+
+
+def _copy_response(url, response, out_file):
+    length = response.headers.get("Content-Length")
+    written = out_file.tell()
+    shutil.copyfileobj(response, out_file, _CHUNK_SIZE)
+    received = out_file.tell() - written
+    if length is not None and received != int(length):
+        raise IOError(
+            f"Download of {url} interrupted after {received} of {length} bytes"
+        )
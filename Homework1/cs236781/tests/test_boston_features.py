@@ -0,0 +1,97 @@
+import warnings
+
+import pytest
+
+import numpy as np
+from sklearn.preprocessing import PolynomialFeatures
+
+from hw1.linear_regression import BostonFeaturesTransformer
+
+N_FEATURES = 13
+
+
+def _boston_like(n_samples, seed=42):
+    # Positive, since CRIM and LSTAT are logged
+    rng = np.random.default_rng(seed)
+    return rng.uniform(0.1, 10, size=(n_samples, N_FEATURES))
+
+
+def _reference_features(X, degree):
+    # Features as computed before the layout in fit(): log CRIM and LSTAT,
+    # delete CHAS, then PolynomialFeatures.
+    X = X.copy()
+    X[:, 0] = np.log(X[:, 0])
+    X[:, 12] = np.log(X[:, 12])
+    X = np.delete(X, 3, axis=1)
+    return PolynomialFeatures(degree).fit_transform(X)
+
+
+class TestPolynomialFeatures(object):
+    @pytest.mark.parametrize("degree", [1, 2, 3])
+    @pytest.mark.parametrize("dtype", [np.float64, np.float32])
+    def test_matches_reference(self, degree, dtype):
+        X = _boston_like(30)
+        transformer = BostonFeaturesTransformer(degree=degree, dtype=dtype, cache=False)
+        X_transformed = transformer.fit(X).transform(X)
+
+        expected = _reference_features(X, degree)
+        assert X_transformed.dtype == dtype
+        assert X_transformed.shape == expected.shape
+        rtol = 1e-12 if dtype == np.float64 else 1e-5
+        np.testing.assert_allclose(X_transformed, expected, rtol=rtol)
+
+    def test_cached_read_only(self):
+        X = _boston_like(30, seed=1)
+        transformer = BostonFeaturesTransformer(degree=2).fit(X)
+        X_transformed = transformer.transform(X)
+
+        assert transformer.transform(X.copy()) is X_transformed
+        assert not X_transformed.flags.writeable
+        with pytest.raises(ValueError):
+            X_transformed[0, 0] = 0
+
+    def test_cache_keyed_on_fitted_degree(self):
+        X = _boston_like(30, seed=2)
+        transformer = BostonFeaturesTransformer(degree=2).fit(X)
+
+        # Changing the parameter without refitting keeps the fitted layout,
+        # which must not be cached as the features of the new degree.
+        transformer.set_params(degree=3)
+        assert transformer.transform(X).shape == _reference_features(X, 2).shape
+
+        X_transformed = BostonFeaturesTransformer(degree=3).fit(X).transform(X)
+        np.testing.assert_allclose(X_transformed, _reference_features(X, 3))
+
+
+class TestRandomFeatureMaps(object):
+    @pytest.mark.parametrize("feature_map", ["tensor_sketch", "nystroem", "rff"])
+    @pytest.mark.parametrize("n_samples", [50, 200])
+    def test_shape(self, feature_map, n_samples):
+        X = _boston_like(n_samples)
+        with warnings.catch_warnings():
+            # Nystroem warns when there are fewer samples than components
+            warnings.simplefilter("ignore", UserWarning)
+            transformer = BostonFeaturesTransformer(
+                feature_map=feature_map, n_components=100, random_state=0
+            ).fit(X)
+        X_transformed = transformer.transform(X[:7])
+
+        n_components = 100
+        if feature_map == "nystroem":
+            n_components = min(n_components, n_samples)
+        assert X_transformed.shape == (7, 1 + n_components)
+        assert transformer.n_output_features_ == X_transformed.shape[1]
+        assert np.all(X_transformed[:, 0] == 1)
+
+    @pytest.mark.parametrize("feature_map", ["tensor_sketch", "nystroem", "rff"])
+    def test_random_state(self, feature_map):
+        X = _boston_like(200)
+
+        def transform(random_state):
+            transformer = BostonFeaturesTransformer(
+                feature_map=feature_map, n_components=20, random_state=random_state
+            )
+            return transformer.fit(X).transform(X)
+
+        np.testing.assert_array_equal(transform(0), transform(0))
+        assert not np.array_equal(transform(0), transform(1))
@@ -1,7 +1,7 @@
 import pytest
 
 import torch
-from torch.utils.data import Dataset, DataLoader
+from torch.utils.data import Dataset, DataLoader, SubsetRandomSampler
 
 import cs236781.dataloader_utils as dl_utils
 
@@ -40,6 +40,62 @@ class TestFlatten(object):
         assert x.shape == y.shape
         assert z.shape == torch.Size([DATASET_SIZE, DATA_SIZE, 1])
 
+    def test_dict(self):
+        loader = DataLoader(TensorDictDataset(), batch_size=256)
+
+        x, y = dl_utils.flatten(loader)
+
+        assert x.shape == torch.Size([DATASET_SIZE, DATA_SIZE, DATA_SIZE])
+        assert y.shape == torch.Size([DATASET_SIZE, DATA_SIZE, 1])
+        assert torch.all(y[:, 0, 0] == torch.arange(DATASET_SIZE))
+
+    def test_sampler_subset(self):
+        indices = list(range(0, DATASET_SIZE, 3))
+        loader = DataLoader(
+            TensorTwoTupleDataset(), batch_size=64, sampler=SubsetRandomSampler(indices)
+        )
+
+        x, y = dl_utils.flatten(loader)
+
+        assert x.shape == torch.Size([len(indices), DATA_SIZE, DATA_SIZE])
+        assert sorted(y[:, 0, 0].tolist()) == indices
+
+    def test_drop_last(self):
+        loader = DataLoader(TensorDataset(), batch_size=256, drop_last=True)
+
+        (x,) = dl_utils.flatten(loader)
+
+        assert x.shape == torch.Size([768, DATA_SIZE, DATA_SIZE])
+        assert torch.all(x[:, 0, 0] == torch.arange(768))
+
+    def test_memmap(self, tmp_path):
+        loader = DataLoader(TensorTwoTupleDataset(), batch_size=256)
+
+        x, y = dl_utils.flatten(loader, out_dir=str(tmp_path))
+
+        assert x.shape == torch.Size([DATASET_SIZE, DATA_SIZE, DATA_SIZE])
+        assert torch.all(y[:, 0, 0] == torch.arange(DATASET_SIZE))
+        assert len(list(tmp_path.glob("*.npy"))) == 2
+
+    def test_batch_sampler_memmap(self, tmp_path):
+        batches = [[0, 1], list(range(2, 12)), list(range(12, 21))]
+        loader = DataLoader(TensorTwoTupleDataset(), batch_sampler=batches)
+
+        x, y = dl_utils.flatten(loader, out_dir=str(tmp_path))
+
+        assert x.shape == torch.Size([21, DATA_SIZE, DATA_SIZE])
+        assert torch.all(y[:, 0, 0] == torch.arange(21))
+
+    def test_sparse(self):
+        loader = DataLoader(
+            TensorTwoTupleDataset(),
+            batch_size=256,
+            collate_fn=lambda b: (torch.stack([x[0][0] for x in b]).to_sparse_csr(),),
+        )
+
+        with pytest.raises(ValueError):
+            dl_utils.flatten(loader)
+
 
 class TensorDataset(Dataset):
     def __len__(self):
@@ -70,3 +126,14 @@ class TensorThreeTupleDataset(Dataset):
             index * torch.ones(DATA_SIZE, DATA_SIZE),
             index * torch.ones(DATA_SIZE, 1),
         )
+
+
+class TensorDictDataset(Dataset):
+    def __len__(self):
+        return DATASET_SIZE
+
+    def __getitem__(self, index):
+        return dict(
+            a=index * torch.ones(DATA_SIZE, DATA_SIZE),
+            b=index * torch.ones(DATA_SIZE, 1),
+        )
@@ -0,0 +1,153 @@
+import pytest
+
+import numpy as np
+import torch
+import torchvision.transforms as T
+from torch.utils.data import Dataset, DataLoader
+
+import cs236781.dataset_cache as ds_cache
+import hw1.transforms as hw1_transforms
+
+DATASET_SIZE = 100
+DATA_SIZE = 10
+
+
+class TestCachedDataset(object):
+    def test_same_samples(self, tmp_path):
+        ds = LabelledDataset()
+        cached = ds_cache.cached_dataset(ds, str(tmp_path), batch_size=32)
+
+        assert len(cached) == len(ds)
+        for i in range(len(ds)):
+            x, y = cached[i]
+            x_, y_ = ds[i]
+            assert torch.equal(x, x_)
+            assert y == y_
+
+    def test_compact_dtype(self, tmp_path):
+        ds = LabelledDataset()
+        cached = ds_cache.cached_dataset(ds, str(tmp_path), dtype=np.uint8)
+
+        x, y = cached.get_batch(slice(0, DATASET_SIZE))
+        assert x.dtype == torch.uint8
+        assert torch.equal(x.float(), torch.stack([ds[i][0] for i in range(len(ds))]))
+        assert torch.equal(y, torch.arange(DATASET_SIZE) % 10)
+
+    def test_scaled_dtype(self, tmp_path):
+        ds = LabelledDataset(scale=1 / 255)
+        cached = ds_cache.cached_dataset(
+            ds, str(tmp_path), dtype=np.uint8, scale=255
+        )
+
+        assert cached.samples.dtype == np.uint8
+        x, _ = cached.get_batch(slice(0, DATASET_SIZE))
+        assert x.dtype == torch.float32
+        assert torch.equal(x, torch.stack([ds[i][0] for i in range(len(ds))]))
+
+    def test_lossy_dtype(self, tmp_path):
+        with pytest.raises(ValueError):
+            ds_cache.cached_dataset(
+                LabelledDataset(scale=1 / 255), str(tmp_path), dtype=np.uint8
+            )
+        assert list(tmp_path.iterdir()) == []
+
+    def test_reuses_cache(self, tmp_path):
+        config = dict(name="labelled")
+        ds_cache.cached_dataset(LabelledDataset(), str(tmp_path), config=config)
+        files = sorted(tmp_path.iterdir())
+
+        # Loading an existing cache must not touch the source dataset
+        cached = ds_cache.cached_dataset(
+            UnreadableDataset(), str(tmp_path), config=config
+        )
+        assert sorted(tmp_path.iterdir()) == files
+        assert len(files) == 2
+        assert len(cached) == DATASET_SIZE
+
+    def test_key_depends_on_config(self):
+        assert ds_cache.dataset_fingerprint(
+            LabelledDataset(scale=1)
+        ) != ds_cache.dataset_fingerprint(LabelledDataset(scale=2))
+
+    def test_key_depends_on_contents(self):
+        ds = LabelledDataset()
+        assert ds_cache.dataset_fingerprint(
+            IndexDataset(ds, torch.tensor([0, 1, 2]))
+        ) != ds_cache.dataset_fingerprint(IndexDataset(ds, torch.tensor([3, 4, 5])))
+        assert ds_cache.dataset_fingerprint(
+            IndexDataset(LabelledDataset(scale=1), torch.arange(3))
+        ) != ds_cache.dataset_fingerprint(
+            IndexDataset(LabelledDataset(scale=2), torch.arange(3))
+        )
+
+    def test_key_requires_config(self, tmp_path):
+        ds = LabelledDataset()
+        ds.loader = lambda i: i
+        with pytest.raises(ValueError):
+            ds_cache.dataset_fingerprint(ds)
+
+        cached = ds_cache.cached_dataset(ds, str(tmp_path), config=dict(name="fn"))
+        assert len(cached) == DATASET_SIZE
+
+    def test_key_of_transforms(self):
+        # Transforms with the default object repr (containing an address)
+        # must give the same key for equal instances
+        def make(*view_dims):
+            ds = LabelledDataset()
+            ds.transform = T.Compose(
+                [hw1_transforms.TensorView(*view_dims), hw1_transforms.BiasTrick()]
+            )
+            return ds
+
+        assert ds_cache.dataset_fingerprint(make(-1)) == ds_cache.dataset_fingerprint(
+            make(-1)
+        )
+        assert ds_cache.dataset_fingerprint(make(-1)) != ds_cache.dataset_fingerprint(
+            make(1, -1)
+        )
+
+    def test_key_of_lambda_transform(self):
+        # All Lambda transforms have the same repr, so they can't be told apart
+        ds = LabelledDataset()
+        ds.transform = T.Lambda(lambda x: x + 1)
+        with pytest.raises(ValueError):
+            ds_cache.dataset_fingerprint(ds)
+
+    def test_dataloader(self, tmp_path):
+        cached = ds_cache.cached_dataset(LabelledDataset(), str(tmp_path))
+        loader = DataLoader(cached, batch_size=16)
+
+        x, y = next(iter(loader))
+        assert x.shape == torch.Size([16, DATA_SIZE])
+        assert y.shape == torch.Size([16])
+
+
+class LabelledDataset(Dataset):
+    def __init__(self, scale=1):
+        self.scale = scale
+
+    def __len__(self):
+        return DATASET_SIZE
+
+    def __getitem__(self, index):
+        return (
+            (index * self.scale % 256) * torch.ones(DATA_SIZE),
+            index % 10,
+        )
+
+
+class UnreadableDataset(LabelledDataset):
+    def __getitem__(self, index):
+        raise AssertionError("Source dataset should not be read")
+
+
+class IndexDataset(Dataset):
+    def __init__(self, source_dataset, indices):
+        self.source_dataset = source_dataset
+        self.indices = indices
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getitem__(self, index):
+        return self.source_dataset[int(self.indices[index])]
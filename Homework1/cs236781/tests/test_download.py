@@ -0,0 +1,263 @@
+import io
+import os
+import hashlib
+import tarfile
+import zipfile
+import threading
+import http.client
+import http.server
+
+import pytest
+
+import cs236781.download as download
+
+FILE_NAME = "data.bin"
+FILE_DATA = bytes(range(256)) * 1000
+
+
+class TestDownloadData(object):
+    def test_download(self, server, tmp_path):
+        out_filename, _ = download.download_data(
+            str(tmp_path), server.url, extract=False, sha256=_sha256(FILE_DATA)
+        )
+
+        assert out_filename == os.path.join(str(tmp_path), FILE_NAME)
+        assert _read(out_filename) == FILE_DATA
+        assert os.listdir(str(tmp_path)) == [FILE_NAME]
+
+    def test_checksum_mismatch(self, server, tmp_path):
+        with pytest.raises(ValueError):
+            download.download_data(
+                str(tmp_path), server.url, extract=False, sha256=_sha256(b"")
+            )
+        assert os.listdir(str(tmp_path)) == []
+
+    def test_existing_file_mismatch(self, server, tmp_path):
+        out_filename = os.path.join(str(tmp_path), FILE_NAME)
+        with open(out_filename, "wb") as f:
+            f.write(b"stale")
+
+        download.download_data(
+            str(tmp_path), server.url, extract=False, sha256=_sha256(FILE_DATA)
+        )
+        assert _read(out_filename) == FILE_DATA
+
+    def test_resume_interrupted(self, server, tmp_path):
+        server.truncate_at = len(FILE_DATA) // 3
+        with pytest.raises((IOError, http.client.HTTPException)):
+            download.download_data(str(tmp_path), server.url, extract=False)
+        assert FILE_NAME not in os.listdir(str(tmp_path))
+
+        server.truncate_at = None
+        out_filename, _ = download.download_data(
+            str(tmp_path), server.url, extract=False
+        )
+        assert _read(out_filename) == FILE_DATA
+        assert server.ranges[-1] == f"bytes={len(FILE_DATA) // 3}-"
+        assert os.listdir(str(tmp_path)) == [FILE_NAME]
+
+    def test_resume_changed_remote(self, server, tmp_path):
+        server.truncate_at = len(FILE_DATA) // 3
+        with pytest.raises((IOError, http.client.HTTPException)):
+            download.download_data(str(tmp_path), server.url, extract=False)
+
+        # A different, shorter version of the file must not be appended to
+        # the bytes of the old one
+        new_data = bytes(reversed(FILE_DATA[: len(FILE_DATA) // 4]))
+        server.data, server.etag, server.truncate_at = new_data, '"v2"', None
+        out_filename, _ = download.download_data(
+            str(tmp_path), server.url, extract=False
+        )
+        assert _read(out_filename) == new_data
+
+    def test_resume_without_validator(self, server, tmp_path):
+        server.etag = None
+        server.truncate_at = len(FILE_DATA) // 3
+        with pytest.raises((IOError, http.client.HTTPException)):
+            download.download_data(str(tmp_path), server.url, extract=False)
+
+        server.truncate_at = None
+        out_filename, _ = download.download_data(
+            str(tmp_path), server.url, extract=False
+        )
+        assert _read(out_filename) == FILE_DATA
+        assert server.ranges[-1] is None
+
+    @pytest.mark.parametrize("stale_size", [len(FILE_DATA), len(FILE_DATA) + 10])
+    def test_complete_part(self, server, tmp_path, stale_size):
+        part_filename = os.path.join(str(tmp_path), f"{FILE_NAME}.part")
+        with open(part_filename, "wb") as f:
+            f.write((FILE_DATA * 2)[:stale_size])
+        with open(f"{part_filename}.validator", "w") as f:
+            f.write(server.etag)
+
+        # Only a part of the remote file's size is accepted as complete
+        out_filename, _ = download.download_data(
+            str(tmp_path), server.url, extract=False
+        )
+        assert _read(out_filename) == FILE_DATA
+        assert os.listdir(str(tmp_path)) == [FILE_NAME]
+
+    def test_parallel_parts_changed_remote(self, server, tmp_path):
+        server.truncate_at = len(FILE_DATA) // 3
+        with pytest.raises((IOError, http.client.HTTPException)):
+            download.download_data(
+                str(tmp_path), server.url, extract=False, num_parts=4
+            )
+
+        new_data = bytes(reversed(FILE_DATA))
+        server.data, server.etag, server.truncate_at = new_data, '"v2"', None
+        out_filename, _ = download.download_data(
+            str(tmp_path), server.url, extract=False, num_parts=4
+        )
+        assert _read(out_filename) == new_data
+        assert os.listdir(str(tmp_path)) == [FILE_NAME]
+
+    @pytest.mark.parametrize("num_parts", [2, 5])
+    def test_parallel_parts(self, server, tmp_path, num_parts):
+        out_filename, _ = download.download_data(
+            str(tmp_path),
+            server.url,
+            extract=False,
+            sha256=_sha256(FILE_DATA),
+            num_parts=num_parts,
+        )
+
+        assert _read(out_filename) == FILE_DATA
+        assert len(server.ranges) == num_parts + 1
+        assert os.listdir(str(tmp_path)) == [FILE_NAME]
+
+    def test_no_range_support(self, server, tmp_path):
+        server.support_ranges = False
+        out_filename, _ = download.download_data(
+            str(tmp_path), server.url, extract=False, num_parts=4
+        )
+        assert _read(out_filename) == FILE_DATA
+
+
+class TestExtract(object):
+    @pytest.mark.parametrize("archive_name", ["archive.zip", "archive.tar.gz"])
+    def test_incremental(self, server, tmp_path, archive_name):
+        server.data = _make_archive(tmp_path / archive_name)
+        out_path = tmp_path / "out"
+        url = f"{server.base_url}/{archive_name}"
+
+        download.download_data(str(out_path), url)
+        extracted_dir = os.path.join(str(out_path), "archive")
+        for name, data in ARCHIVE_FILES.items():
+            assert _read(os.path.join(extracted_dir, name)) == data
+
+        # Files matching the manifest aren't extracted again, others are
+        untouched = os.path.join(extracted_dir, "a.txt")
+        with open(untouched, "wb") as f:
+            f.write(b"A" * len(ARCHIVE_FILES["a.txt"]))
+        os.remove(os.path.join(extracted_dir, "sub", "c.txt"))
+        with open(os.path.join(extracted_dir, "b.txt"), "wb") as f:
+            f.write(b"truncated")
+
+        download.download_data(str(out_path), url)
+        assert _read(untouched) == b"A" * len(ARCHIVE_FILES["a.txt"])
+        for name in ("b.txt", "sub/c.txt"):
+            assert _read(os.path.join(extracted_dir, name)) == ARCHIVE_FILES[name]
+
+
+class RangeRequestHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Serves the server's data with optional Range and If-Range support, and
+    can simulate a dropped connection.
+    """
+
+    def do_GET(self):
+        server = self.server
+        data = server.data
+        range_header = self.headers.get("Range")
+        server.ranges.append(range_header)
+
+        if_range = self.headers.get("If-Range")
+        if if_range is not None and if_range != server.etag:
+            range_header = None
+
+        start, end = 0, len(data)
+        if range_header and server.support_ranges:
+            first, last = range_header[len("bytes="):].split("-")
+            start = int(first)
+            end = int(last) + 1 if last else len(data)
+            if start >= len(data):
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{len(data)}")
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header(
+                "Content-Range", f"bytes {start}-{end - 1}/{len(data)}"
+            )
+        else:
+            self.send_response(200)
+        if server.etag is not None:
+            self.send_header("ETag", server.etag)
+        self.send_header("Content-Length", str(end - start))
+        self.end_headers()
+
+        if server.truncate_at is not None:
+            end = min(end, server.truncate_at)
+        self.wfile.write(data[start:end])
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), RangeRequestHandler)
+    httpd.data = FILE_DATA
+    httpd.etag = '"v1"'
+    httpd.ranges = []
+    httpd.support_ranges = True
+    httpd.truncate_at = None
+    httpd.base_url = f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.url = f"{httpd.base_url}/{FILE_NAME}"
+
+    thread = threading.Thread(target=httpd.serve_forever, args=(0.01,), daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+ARCHIVE_FILES = {
+    "a.txt": b"a" * 100,
+    "b.txt": bytes(range(256)) * 10,
+    "sub/c.txt": b"c" * 1000,
+}
+
+
+def _make_archive(path):
+    path = str(path)
+    if path.endswith(".zip"):
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zipf:
+            zipf.writestr("archive/", b"")
+            for name, data in ARCHIVE_FILES.items():
+                zipf.writestr(f"archive/{name}", data)
+    else:
+        with tarfile.open(path, "w:gz") as tarf:
+            for name in ("archive", "archive/sub"):
+                ti = tarfile.TarInfo(name)
+                ti.type = tarfile.DIRTYPE
+                ti.mode = 0o755
+                tarf.addfile(ti)
+            for name, data in ARCHIVE_FILES.items():
+                ti = tarfile.TarInfo(f"archive/{name}")
+                ti.size = len(data)
+                tarf.addfile(ti, io.BytesIO(data))
+    data = _read(path)
+    os.remove(path)
+    return data
+
+
+def _sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def _read(filename):
+    with open(filename, "rb") as f:
+        return f.read()
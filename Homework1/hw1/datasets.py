@@ -1,12 +1,14 @@
 import torch
+import numpy as np
 from torch import Tensor
-from typing import Tuple, Iterator
+from typing import Tuple, Iterator, Sequence, List
 from contextlib import contextmanager
-from torch.utils.data import Dataset, IterableDataset
+from torch.utils.data import Dataset, IterableDataset, get_worker_info
 
 
 def random_labelled_image(
         shape: Tuple[int, ...], num_classes: int, low=0, high=255, dtype=torch.int,
+        generator: torch.Generator = None,
 ) -> Tuple[Tensor, int]:
     """
     Generates a random image and a random class label for it.
@@ -15,15 +17,16 @@ def random_labelled_image(
     :param low: Minimal value in the image (inclusive).
     :param high: Maximal value in the image (exclusive).
     :param dtype: Data type of the returned image tensor.
+    :param generator: Optional generator to draw from instead of the global RNG.
     :return: A tuple containing the generated image tensor and it's label.
     """
     # TODO:
     #  Implement according to the docstring description.
     # ====== YOUR CODE: ======
     # Generate a random image with uniform distribution on [low, high)
-    image = torch.randint(low=low, high=high, size=shape, dtype=dtype)
+    image = torch.randint(low=low, high=high, size=shape, dtype=dtype, generator=generator)
     # .item() converts this single-element tensor into a Python scalar (integer).
-    label = torch.randint(low=0, high=num_classes, size=(1,)).item()
+    label = torch.randint(low=0, high=num_classes, size=(1,), generator=generator).item()
     # ========================
     return image, label
 
@@ -90,11 +93,46 @@ class RandomImageDataset(Dataset):
         # ====== YOUR CODE: ======
         if index < 0 or index >= self.num_samples:
             raise ValueError()
-        temp_seed = index
-        with torch_temporary_seed(temp_seed):
-            return random_labelled_image(shape=self.image_dim, num_classes=self.num_classes)
+        # A private generator seeded with the index gives the same sample as
+        # torch_temporary_seed(index) would, without touching the global RNG.
+        generator = torch.Generator().manual_seed(index)
+        return random_labelled_image(
+            shape=self.image_dim, num_classes=self.num_classes, generator=generator
+        )
         # ========================
 
+    def get_batch(self, indices: Sequence[int]) -> Tuple[Tensor, Tensor]:
+        """
+        Returns a batch of labeled samples, bit-identical to indexing each
+        sample separately. The batch is written into preallocated tensors and
+        the global RNG state is never touched.
+        :param indices: Sequence of sample indices.
+        :return: A tuple (samples, labels) of an image tensor of shape
+        (B, C, W, H) and a label tensor of shape (B,).
+        Raises a ValueError if any index is out of range.
+        """
+        images = torch.empty((len(indices), *self.image_dim), dtype=torch.int)
+        labels = torch.empty((len(indices),), dtype=torch.long)
+        generator = torch.Generator()
+        for i, index in enumerate(indices):
+            if index < 0 or index >= self.num_samples:
+                raise ValueError()
+            # Same draws, in the same order, as random_labelled_image().
+            generator.manual_seed(index)
+            torch.randint(0, 255, self.image_dim, generator=generator, out=images[i])
+            torch.randint(0, self.num_classes, (1,), generator=generator, out=labels[i:i + 1])
+        return images, labels
+
+    def __getitems__(self, indices: Sequence[int]) -> List[Tuple[Tensor, int]]:
+        """
+        Batched fetch used by DataLoader instead of calling __getitem__ per index.
+        :param indices: Sequence of sample indices.
+        :return: A list of (sample, label) tuples, where the samples are views
+        into a single batch tensor.
+        """
+        images, labels = self.get_batch(indices)
+        return list(zip(images, labels.tolist()))
+
     def __len__(self):
         """
         :return: Number of samples in this dataset.
@@ -109,16 +147,47 @@ class ImageStreamDataset(IterableDataset):
     A dataset representing an infinite stream of noise images of specified dimensions.
     """
 
-    def __init__(self, num_classes: int, C: int, W: int, H: int):
+    def __init__(
+        self, num_classes: int, C: int, W: int, H: int, seed: int = None, chunk_size=1,
+    ):
         """
         :param num_classes: Number of classes (labels)
         :param C: Number of channels per image
         :param W: Image width
         :param H: Image height
+        :param seed: Optional seed for a reproducible stream. When loading with
+        multiple workers, worker i draws from its own generator seeded from
+        the pair (seed, i), so that no two (seed, worker) pairs share a
+        stream. If None, the global RNG is used in the main process and the
+        per-worker seed assigned by the DataLoader is used in workers.
+        :param chunk_size: Number of images to generate at once. Images are
+        generated in blocks with a single call to the RNG and yielded as views.
         """
         super().__init__()
+        if chunk_size < 1:
+            raise ValueError(chunk_size)
         self.num_classes = num_classes
         self.image_dim = (C, W, H)
+        self.seed = seed
+        self.chunk_size = chunk_size
+
+    def _generator(self):
+        """
+        :return: The generator this iterator should draw from, or None to use
+        the global RNG.
+        """
+        worker_info = get_worker_info()
+        if worker_info is None:
+            seed = self.seed
+        elif self.seed is None:
+            seed = worker_info.seed
+        else:
+            seed_seq = np.random.SeedSequence([self.seed, worker_info.id])
+            seed = int(seed_seq.generate_state(1, np.uint64)[0])
+
+        if seed is None:
+            return None
+        return torch.Generator().manual_seed(seed)
 
     def __iter__(self) -> Iterator[Tuple[Tensor, int]]:
         """
@@ -129,8 +198,18 @@ class ImageStreamDataset(IterableDataset):
         #  Yield tuples to produce an iterator over random images and labels.
         #  The iterator should produce an infinite stream of data.
         # ====== YOUR CODE: ======
+        generator = self._generator()
+        if self.chunk_size == 1:
+            while True:
+                yield random_labelled_image(
+                    shape=self.image_dim, num_classes=self.num_classes, generator=generator
+                )
+
+        chunk_shape = (self.chunk_size, *self.image_dim)
         while True:
-            yield random_labelled_image(shape=self.image_dim, num_classes=self.num_classes)
+            images = torch.randint(0, 255, chunk_shape, dtype=torch.int, generator=generator)
+            labels = torch.randint(0, self.num_classes, (self.chunk_size,), generator=generator)
+            yield from zip(images, labels.tolist())
         # ========================
 
 
@@ -167,3 +246,78 @@ class SubsetDataset(Dataset):
         # ====== YOUR CODE: ======
         return self.subset_len
         # ========================
+
+
+class IndexViewDataset(Dataset):
+    """
+    A dataset that wraps another dataset, returning the samples at a given set
+    of indices from it. Views of views (and of SubsetDatasets) are composed by
+    index arithmetic, so they always wrap the underlying source directly.
+    """
+
+    def __init__(self, source_dataset: Dataset, indices):
+        """
+        Create an IndexViewDataset from another dataset.
+        :param source_dataset: The dataset to take samples from.
+        :param indices: The indices of the source dataset samples to take. Can be
+            a slice, a range, or a 1D sequence/tensor of integers.
+        """
+        local_indices = self._local_indices(indices, len(source_dataset))
+
+        if isinstance(source_dataset, IndexViewDataset):
+            base_indices = source_dataset.indices
+            source_dataset = source_dataset.source_dataset
+        elif isinstance(source_dataset, SubsetDataset):
+            offset = source_dataset.offset
+            base_indices = torch.arange(offset, offset + source_dataset.subset_len)
+            source_dataset = source_dataset.source_dataset
+        else:
+            base_indices = torch.arange(len(source_dataset))
+
+        self.source_dataset = source_dataset
+        # Indexing with a slice returns a view of the base indices.
+        self.indices = base_indices[local_indices]
+
+    @staticmethod
+    def _local_indices(indices, n):
+        """
+        Converts indices into something which can index a tensor of length n:
+        a slice for ranges with a positive step, or a 1D long tensor otherwise.
+        Raises a ValueError if any index is out of range.
+        """
+        if isinstance(indices, slice):
+            indices = range(n)[indices]
+
+        if isinstance(indices, range):
+            if len(indices) > 0 and not (0 <= min(indices) and max(indices) < n):
+                raise ValueError("Not enough samples in source dataset")
+            if indices.step > 0:
+                return slice(indices.start, indices.stop, indices.step)
+            return torch.arange(indices.start, indices.stop, indices.step)
+
+        indices = torch.as_tensor(indices, dtype=torch.long)
+        if indices.dim() != 1:
+            raise ValueError("Indices must be one-dimensional")
+        if len(indices) > 0 and not (0 <= indices.min() and indices.max() < n):
+            raise ValueError("Not enough samples in source dataset")
+        return indices
+
+    def __getitem__(self, index):
+        if index < 0 or index >= len(self.indices):
+            raise IndexError()
+        return self.source_dataset[int(self.indices[index])]
+
+    def __getitems__(self, indices):
+        """
+        Batched fetch, forwarded to the source dataset in a single call if it
+        supports it.
+        :param indices: Sequence of indices into this dataset.
+        :return: A list of samples.
+        """
+        source_indices = self.indices[torch.as_tensor(indices, dtype=torch.long)].tolist()
+        if hasattr(self.source_dataset, "__getitems__"):
+            return self.source_dataset.__getitems__(source_indices)
+        return [self.source_dataset[i] for i in source_indices]
+
+    def __len__(self):
+        return len(self.indices)
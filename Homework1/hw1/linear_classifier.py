@@ -1,8 +1,12 @@
 import torch
+import torch.multiprocessing as mp
+from multiprocessing import connection as mp_connection
 from torch import Tensor
+from typing import Sequence
 from collections import namedtuple
 from torch.utils.data import DataLoader
 
+import cs236781.dataloader_utils as dl_utils
 from .losses import ClassifierLoss
 
 
@@ -28,6 +32,7 @@ class LinearClassifier(object):
         """
         Predict the class of a batch of samples based on the current weights.
         :param x: A tensor of shape (N,n_features) where N is the batch size.
+            Can be a sparse CSR tensor.
         :return:
             y_pred: Tensor of shape (N,) where each entry is the predicted
                 class of the corresponding sample. Predictions are integers in
@@ -75,7 +80,40 @@ class LinearClassifier(object):
         learn_rate=0.1,
         weight_decay=0.001,
         max_epochs=100,
+        preload=False,
+        num_processes=1,
     ):
+        """
+        Trains the classifier with SGD.
+        :param dl_train: DataLoader of the training set.
+        :param dl_valid: DataLoader of the validation set.
+        :param loss_fn: The loss function to minimize.
+        :param learn_rate: Learning rate.
+        :param weight_decay: L2 regularization strength.
+        :param max_epochs: Number of epochs to train for.
+        :param preload: Whether to load both sets only once into contiguous
+            tensors on the weights' device, and slice each epoch's minibatches
+            from them by a random permutation. Loss and accuracy then stay on
+            the device until the end of each epoch. Requires dense batches; a
+            ValueError is raised before training if they are sparse.
+        :param num_processes: Number of worker processes to train with. If
+            greater than 1, the data is preloaded as above, the weights are
+            moved to shared memory and each worker applies lock-free
+            (Hogwild) SGD updates to them from its own disjoint shard of the
+            training set. Validation is evaluated by the calling process at
+            the end of each epoch. CPU and dense batches only.
+        :return: A tuple of (train, valid) results, each with the average
+            accuracy and loss per epoch.
+        """
+        if num_processes > 1:
+            return self._train_hogwild(
+                dl_train, dl_valid, loss_fn, learn_rate, weight_decay,
+                max_epochs, num_processes,
+            )
+        if preload:
+            return self._train_preloaded(
+                dl_train, dl_valid, loss_fn, learn_rate, weight_decay, max_epochs
+            )
 
         Result = namedtuple("Result", "accuracy loss")
         train_res = Result(accuracy=[], loss=[])
@@ -103,9 +141,10 @@ class LinearClassifier(object):
             for x, y in dl_train:
                 y_pred, class_scores = self.predict(x)
                 accuracy_train += self.evaluate_accuracy(y, y_pred)
-                loss = loss_fn(x, y, class_scores, y_pred) + (0.5 * weight_decay * torch.sum(self.weights ** 2))
+                loss, grad = loss_fn.loss_and_grad(x, y, class_scores, y_pred)
+                loss = loss + (0.5 * weight_decay * torch.sum(self.weights ** 2))
                 cumulative_loss_train += loss.item()
-                grad = loss_fn.grad() + weight_decay*self.weights
+                grad = grad + weight_decay*self.weights
                 self.weights -= learn_rate * grad
 
             train_res.accuracy.append(accuracy_train / len(dl_train))
@@ -126,6 +165,138 @@ class LinearClassifier(object):
         print("")
         return train_res, valid_res
 
+    def _train_preloaded(
+        self, dl_train, dl_valid, loss_fn, learn_rate, weight_decay, max_epochs,
+    ):
+        Result = namedtuple("Result", "accuracy loss")
+        train_res = Result(accuracy=[], loss=[])
+        valid_res = Result(accuracy=[], loss=[])
+
+        device = self.weights.device
+        x_train, y_train = (t.to(device) for t in dl_utils.flatten(dl_train))
+        x_valid, y_valid = (t.to(device) for t in dl_utils.flatten(dl_valid))
+        train_batch_size = dl_train.batch_size or len(x_train)
+        valid_batch_size = dl_valid.batch_size or len(x_valid)
+
+        print("Training", end="")
+        for epoch_idx in range(max_epochs):
+            perm = torch.randperm(len(x_train), device=device)
+            accuracy, loss = self._run_epoch_preloaded(
+                x_train, y_train, perm, train_batch_size, loss_fn, weight_decay, learn_rate
+            )
+            train_res.accuracy.append(accuracy)
+            train_res.loss.append(loss)
+
+            accuracy, loss = self._run_epoch_preloaded(
+                x_valid, y_valid, None, valid_batch_size, loss_fn, weight_decay
+            )
+            valid_res.accuracy.append(accuracy)
+            valid_res.loss.append(loss)
+            print(".", end="")
+
+        print("")
+        return train_res, valid_res
+
+    def _train_hogwild(
+        self, dl_train, dl_valid, loss_fn, learn_rate, weight_decay, max_epochs,
+        num_processes,
+    ):
+        Result = namedtuple("Result", "accuracy loss")
+        train_res = Result(accuracy=[], loss=[])
+        valid_res = Result(accuracy=[], loss=[])
+
+        if self.weights.device.type != "cpu":
+            raise ValueError("Multi-process training is only supported on CPU")
+        x_train, y_train = dl_utils.flatten(dl_train)
+        x_valid, y_valid = dl_utils.flatten(dl_valid)
+        train_batch_size = dl_train.batch_size or len(x_train)
+        valid_batch_size = dl_valid.batch_size or len(x_valid)
+
+        # Workers see the same storage, so updates made by one are visible to
+        # all the others (and to us) without any copying or locking.
+        self.weights.share_memory_()
+        x_train.share_memory_()
+        y_train.share_memory_()
+        # Per-worker (loss, accuracy, n_batches) sums of the current epoch
+        stats = torch.zeros(num_processes, 3).share_memory_()
+
+        ctx = mp.get_context()
+        # Synchronizes the end of each epoch: once for the workers to report
+        # their stats, and once for us to finish evaluating before they go on.
+        barrier = ctx.Barrier(num_processes + 1)
+        processes = [
+            ctx.Process(
+                target=_hogwild_worker,
+                args=(
+                    rank, num_processes, self, x_train, y_train,
+                    train_batch_size, loss_fn, learn_rate, weight_decay,
+                    max_epochs, stats, barrier,
+                ),
+                daemon=True,
+            )
+            for rank in range(num_processes)
+        ]
+
+        print("Training", end="")
+        try:
+            for p in processes:
+                p.start()
+            for epoch_idx in range(max_epochs):
+                _wait_for_workers(barrier, processes)
+                loss, accuracy, n_batches = stats.sum(dim=0).tolist()
+                train_res.accuracy.append(accuracy * 100 / n_batches)
+                train_res.loss.append(loss / n_batches)
+
+                accuracy, loss = self._run_epoch_preloaded(
+                    x_valid, y_valid, None, valid_batch_size, loss_fn, weight_decay
+                )
+                valid_res.accuracy.append(accuracy)
+                valid_res.loss.append(loss)
+                _wait_for_workers(barrier, processes)
+                print(".", end="")
+            for p in processes:
+                p.join()
+        finally:
+            barrier.abort()
+            for p in processes:
+                if p.is_alive():
+                    p.terminate()
+
+        print("")
+        return train_res, valid_res
+
+    def _run_epoch_preloaded(
+        self, x_all, y_all, perm, batch_size, loss_fn, weight_decay, learn_rate=None,
+    ):
+        """
+        Runs one epoch over preloaded data, updating the weights if a learning
+        rate is given.
+        :return: The average accuracy and loss per batch.
+        """
+        device = self.weights.device
+        total_accuracy = torch.zeros((), device=device)
+        total_loss = torch.zeros((), device=device)
+        n_batches = 0
+        for start in range(0, len(x_all), batch_size):
+            if perm is None:
+                x, y = x_all[start:start + batch_size], y_all[start:start + batch_size]
+            else:
+                idx = perm[start:start + batch_size]
+                x, y = x_all[idx], y_all[idx]
+
+            y_pred, class_scores = self.predict(x)
+            total_accuracy += (y == y_pred).float().mean()
+            reg_loss = 0.5 * weight_decay * torch.sum(self.weights ** 2)
+            if learn_rate is not None:
+                loss, grad = loss_fn.loss_and_grad(x, y, class_scores, y_pred)
+                self.weights -= learn_rate * (grad + weight_decay * self.weights)
+            else:
+                loss = loss_fn(x, y, class_scores, y_pred)
+            total_loss += loss.detach() + reg_loss
+            n_batches += 1
+
+        return total_accuracy.item() * 100 / n_batches, total_loss.item() / n_batches
+
     def weights_as_images(self, img_shape, has_bias=True):
         """
         Create tensor images from the weights, for visualization.
@@ -151,6 +322,166 @@ class LinearClassifier(object):
         return w_images
 
 
+class LinearClassifierEnsemble(object):
+    """
+    K linear classifiers with different hyperparameters, trained together
+    with a single pass over the data per epoch.
+    """
+
+    def __init__(self, n_features, n_classes, hyperparams: Sequence[dict]):
+        """
+        Initializes the ensemble.
+        :param n_features: Number or features in each sample.
+        :param n_classes: Number of classes samples can belong to.
+        :param hyperparams: A sequence of K dicts, one per classifier, each
+            with the weight_std, learn_rate and weight_decay keys (as returned
+            by hyperparams()).
+        """
+        self.n_features = n_features
+        self.n_classes = n_classes
+        self.hyperparams = [dict(hp) for hp in hyperparams]
+
+        # Per-classifier hyperparameters, shaped to broadcast over (K, D, C)
+        def hp_tensor(name):
+            return torch.tensor([hp[name] for hp in self.hyperparams]).view(-1, 1, 1)
+
+        weight_std = hp_tensor("weight_std")
+        self.learn_rates = hp_tensor("learn_rate")
+        self.weight_decays = hp_tensor("weight_decay")
+
+        K = len(self.hyperparams)
+        self.weights = torch.randn(K, n_features, n_classes) * weight_std
+
+    def predict(self, x: Tensor):
+        """
+        Predict the class of a batch of samples with each classifier.
+        :param x: A tensor of shape (N,n_features) where N is the batch size.
+            Can be a sparse CSR tensor.
+        :return:
+            y_pred: Tensor of shape (K,N) with each classifier's predictions.
+            class_scores: Tensor of shape (K,N,n_classes) with each
+                classifier's class scores.
+        """
+        if x.layout == torch.sparse_csr:
+            # Sparse matmul only supports 2D operands, so fold K into the columns
+            K, D, C = self.weights.shape
+            weights = self.weights.movedim(0, 1).reshape(D, K * C)
+            class_scores = (x @ weights).reshape(-1, K, C).movedim(1, 0)
+        else:
+            class_scores = x @ self.weights
+        y_pred = torch.argmax(class_scores, dim=-1)
+        return y_pred, class_scores
+
+    def train(
+        self,
+        dl_train: DataLoader,
+        dl_valid: DataLoader,
+        loss_fn: ClassifierLoss,
+        max_epochs=100,
+    ):
+        """
+        Trains all classifiers with SGD, each with its own hyperparameters.
+        :param dl_train: DataLoader of the training set.
+        :param dl_valid: DataLoader of the validation set.
+        :param loss_fn: The loss function to minimize. It must support scores
+            of shape (K,N,C), as SVMHingeLoss does.
+        :param max_epochs: Number of epochs to train for.
+        :return: A tuple of (train, valid) results. Each is a list with one
+            result per classifier, in the same format LinearClassifier.train()
+            returns.
+        """
+        Result = namedtuple("Result", "accuracy loss")
+        K = len(self.hyperparams)
+        train_res = [Result(accuracy=[], loss=[]) for _ in range(K)]
+        valid_res = [Result(accuracy=[], loss=[]) for _ in range(K)]
+
+        print("Training", end="")
+        for epoch_idx in range(max_epochs):
+            for dl, res, update in ((dl_train, train_res, True), (dl_valid, valid_res, False)):
+                total_accuracy = torch.zeros(K)
+                total_loss = torch.zeros(K)
+                for x, y in dl:
+                    y_pred, class_scores = self.predict(x)
+                    total_accuracy += (y == y_pred).float().mean(dim=-1)
+                    reg_loss = 0.5 * self.weight_decays.view(-1) * torch.sum(self.weights ** 2, dim=(1, 2))
+                    if update:
+                        loss, grad = loss_fn.loss_and_grad(x, y, class_scores, y_pred)
+                        self.weights -= self.learn_rates * (grad + self.weight_decays * self.weights)
+                    else:
+                        loss = loss_fn(x, y, class_scores, y_pred)
+                    total_loss += loss + reg_loss
+
+                for k in range(K):
+                    res[k].accuracy.append(total_accuracy[k].item() * 100 / len(dl))
+                    res[k].loss.append(total_loss[k].item() / len(dl))
+            print(".", end="")
+
+        print("")
+        return train_res, valid_res
+
+    def classifier(self, k) -> LinearClassifier:
+        """
+        :param k: Index of a classifier in the ensemble.
+        :return: A LinearClassifier with the weights of the k-th classifier.
+        """
+        cls = LinearClassifier(
+            self.n_features, self.n_classes, weight_std=self.hyperparams[k]["weight_std"]
+        )
+        cls.weights = self.weights[k].clone()
+        return cls
+
+
+def _wait_for_workers(barrier, processes, poll_interval=0.01):
+    """
+    Waits on a barrier shared with worker processes, once all of them reached
+    it. Raises a RuntimeError if any worker exits before that, instead of
+    waiting forever.
+    """
+    while barrier.n_waiting < len(processes):
+        for p in processes:
+            if not p.is_alive():
+                raise RuntimeError(
+                    f"Training worker {p.name} exited with code {p.exitcode}"
+                )
+        # Returns early if a worker exits
+        mp_connection.wait([p.sentinel for p in processes], timeout=poll_interval)
+    barrier.wait()
+
+
+def _hogwild_worker(
+    rank, num_processes, classifier, x_all, y_all, batch_size, loss_fn,
+    learn_rate, weight_decay, max_epochs, stats, barrier,
+):
+    """
+    Trains a LinearClassifier whose weights are in shared memory on the shard
+    of the training set belonging to the given rank, without any locking.
+    See LinearClassifier.train().
+    """
+    # Each worker is one of many; intra-op threads would only oversubscribe.
+    torch.set_num_threads(1)
+    weights = classifier.weights
+    shard = torch.arange(rank, len(x_all), num_processes)
+
+    for epoch_idx in range(max_epochs):
+        total_accuracy, total_loss, n_batches = 0.0, 0.0, 0
+        perm = shard[torch.randperm(len(shard))]
+        for start in range(0, len(perm), batch_size):
+            idx = perm[start:start + batch_size]
+            x, y = x_all[idx], y_all[idx]
+
+            y_pred, class_scores = classifier.predict(x)
+            total_accuracy += (y == y_pred).float().mean().item()
+            reg_loss = 0.5 * weight_decay * torch.sum(weights ** 2)
+            loss, grad = loss_fn.loss_and_grad(x, y, class_scores, y_pred)
+            weights.sub_(learn_rate * (grad + weight_decay * weights))
+            total_loss += (loss.detach() + reg_loss).item()
+            n_batches += 1
+
+        stats[rank] = torch.tensor([total_loss, total_accuracy, n_batches])
+        barrier.wait()
+        barrier.wait()
+
+
 def hyperparams():
     hp = dict(weight_std=0.0, learn_rate=0.0, weight_decay=0.0)
 
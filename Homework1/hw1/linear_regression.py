@@ -1,11 +1,16 @@
+import hashlib
+import itertools
 import numpy as np
 import sklearn
+import scipy.linalg
 from pandas import DataFrame
 from typing import List
+from collections import OrderedDict
 from sklearn.base import BaseEstimator, RegressorMixin, TransformerMixin
 from sklearn.utils import check_array
 from sklearn.pipeline import Pipeline
-from sklearn.preprocessing import PolynomialFeatures
+from sklearn.model_selection import KFold
+from sklearn.kernel_approximation import Nystroem, PolynomialCountSketch, RBFSampler
 from sklearn.utils.validation import check_X_y, check_is_fitted
 
 
@@ -14,8 +19,20 @@ class LinearRegressor(BaseEstimator, RegressorMixin):
     Implements Linear Regression prediction and closed-form parameter fitting.
     """
 
-    def __init__(self, reg_lambda=0.1):
+    def __init__(self, reg_lambda=0.1, solver="inv", chunk_size=None):
+        """
+        :param reg_lambda: Regularization strength.
+        :param solver: How to solve the regularized normal equations: 'inv'
+            (explicit inverse), 'solve' (LU solve) or 'cholesky' (Cholesky
+            factorization, falling back to 'solve' if the system is not
+            positive definite).
+        :param chunk_size: If not None, fit() accumulates X^T X and X^T y
+            over chunks of this many rows, so X can be e.g. a memmap larger
+            than memory.
+        """
         self.reg_lambda = reg_lambda
+        self.solver = solver
+        self.chunk_size = chunk_size
 
     def predict(self, X):
         """
@@ -43,6 +60,13 @@ class LinearRegressor(BaseEstimator, RegressorMixin):
         :param X: A tensor of shape (N,n_features_) where N is the batch size.
         :param y: A tensor of shape (N,) where N is the batch size.
         """
+        if self.chunk_size is not None:
+            chunks = (
+                (X[i:i + self.chunk_size], y[i:i + self.chunk_size])
+                for i in range(0, len(X), self.chunk_size)
+            )
+            return self.fit_chunks(chunks)
+
         X, y = check_X_y(X, y)
 
         # TODO:
@@ -53,19 +77,187 @@ class LinearRegressor(BaseEstimator, RegressorMixin):
         # w_opt = (X^TX/N +lambda *I )^-1 * (x^Ty/N)
         # ====== YOUR CODE: ======
         N = X.shape[0]
-        M = X.shape[1]
         gram = X.T @ X
-        identity = np.identity(n=gram.shape[0])
-        identity[0, 0] = 0 # optimal b should not include regularization
-        w_opt = np.linalg.inv(gram/N + self.reg_lambda * identity) @ (X.T @ y / N)
+        # Keep the sufficient statistics, so partial_fit() can continue from here
+        self.gram_, self.xty_, self.n_samples_ = gram, X.T @ y, N
+        w_opt = self._solve(gram, self.xty_, N)
         # ========================
         self.weights_ = w_opt
         return self
 
+    def fit_chunks(self, chunks):
+        """
+        Fit optimal weights from an iterable of chunks of rows, accumulating
+        X^T X and X^T y so that memory scales with D^2 rather than N*D.
+        :param chunks: An iterable of (X, y) tuples with arrays of shapes
+            (n,n_features_) and (n,).
+        """
+        gram, xty, N = None, None, 0
+        for X, y in chunks:
+            X, y = check_X_y(X, y)
+            if gram is None:
+                gram = np.zeros((X.shape[1], X.shape[1]))
+                xty = np.zeros(X.shape[1])
+            gram += X.T @ X
+            xty += X.T @ y
+            N += X.shape[0]
+
+        if gram is None:
+            raise ValueError("No data to fit")
+
+        self.gram_, self.xty_, self.n_samples_ = gram, xty, N
+        self.weights_ = self._solve(gram, xty, N)
+        return self
+
+    def partial_fit(self, X, y):
+        """
+        Incrementally fit on a new batch of rows. The weights are the same as
+        fit() would give on all rows seen so far (including those of a
+        previous fit()), but the cost depends only on the batch size and the
+        number of features: X^T X and X^T y are updated with the batch's
+        rank-k contribution and the system is re-solved.
+        :param X: A tensor of shape (k,n_features_) where k is the batch size.
+        :param y: A tensor of shape (k,) where k is the batch size.
+        """
+        X, y = check_X_y(X, y)
+        if not hasattr(self, "gram_"):
+            self.gram_ = np.zeros((X.shape[1], X.shape[1]))
+            self.xty_ = np.zeros(X.shape[1])
+            self.n_samples_ = 0
+
+        self.gram_ += X.T @ X
+        self.xty_ += X.T @ y
+        self.n_samples_ += X.shape[0]
+        self.weights_ = self._solve(self.gram_, self.xty_, self.n_samples_)
+        return self
+
+    def remove(self, X, y):
+        """
+        Removes rows which were previously fitted, e.g. the oldest batch of a
+        sliding window, and updates the weights accordingly.
+        :param X: A tensor of shape (k,n_features_) where k is the batch size.
+        :param y: A tensor of shape (k,) where k is the batch size.
+        """
+        check_is_fitted(self, "gram_")
+        X, y = check_X_y(X, y)
+        if X.shape[0] >= self.n_samples_:
+            raise ValueError("Can't remove all fitted samples")
+
+        self.gram_ -= X.T @ X
+        self.xty_ -= X.T @ y
+        self.n_samples_ -= X.shape[0]
+        self.weights_ = self._solve(self.gram_, self.xty_, self.n_samples_)
+        return self
+
+    def _solve(self, gram, xty, N):
+        """
+        Solves the regularized normal equations (X^TX/N + lambda*I) w = X^Ty/N.
+        """
+        identity = np.identity(n=gram.shape[0])
+        identity[0, 0] = 0 # optimal b should not include regularization
+        A = gram / N + self.reg_lambda * identity
+        b = xty / N
+
+        if self.solver == "inv":
+            return np.linalg.inv(A) @ b
+        if self.solver == "cholesky":
+            try:
+                return scipy.linalg.cho_solve(scipy.linalg.cho_factor(A), b)
+            except np.linalg.LinAlgError:
+                return np.linalg.solve(A, b)
+        if self.solver == "solve":
+            return np.linalg.solve(A, b)
+        raise ValueError(f"Unknown solver {self.solver}")
+
+    def fit_path(self, X, y, lambdas):
+        """
+        Fit optimal weights for many values of the regularization
+        hyperparameter at once, using a single eigendecomposition.
+        :param X: A tensor of shape (N,n_features_) where N is the batch size.
+        :param y: A tensor of shape (N,) where N is the batch size.
+        :param lambdas: Sequence of L values of reg_lambda.
+        :return: An array of shape (L, n_features_) with the weights for each
+            value of reg_lambda. The model's own weights are not changed.
+        """
+        X, y = check_X_y(X, y)
+        return _RidgePath(X, y).weights(lambdas)
+
+    def loo_score(self, X, y, lambdas=None):
+        """
+        Computes the exact leave-one-out MSE, i.e. the mean squared error on
+        each sample of a model fitted on all the other samples, in closed form
+        from the hat matrix diagonal of a single fit.
+        :param X: A tensor of shape (N,n_features_) where N is the batch size.
+        :param y: A tensor of shape (N,) where N is the batch size.
+        :param lambdas: Optional sequence of L values of reg_lambda to score.
+        :return: The LOO MSE for this model's reg_lambda, or an array of shape
+            (L,) with the LOO MSE for each value in lambdas if given.
+        """
+        X, y = check_X_y(X, y)
+        if lambdas is None:
+            return _RidgePath(X, y).loo_mse(X, y, [self.reg_lambda])[0]
+        return _RidgePath(X, y).loo_mse(X, y, lambdas)
+
     def fit_predict(self, X, y):
         return self.fit(X, y).predict(X)
 
 
+class _RidgePath(object):
+    """
+    Decomposition of LinearRegressor's regularized normal equations which
+    gives the solution for any reg_lambda in O(D^2).
+    The unregularized first feature is projected out of the others, which
+    leaves a plain ridge problem, solved via an eigendecomposition of its
+    Gram matrix.
+    """
+
+    def __init__(self, X, y):
+        N = X.shape[0]
+        x0, Xr = X[:, 0], X[:, 1:]
+        x0_sq = x0 @ x0
+        # Projection coefficients of the other features and the target on x0
+        self.a = (x0 @ Xr) / x0_sq if x0_sq > 0 else np.zeros(Xr.shape[1])
+        self.a_y = (x0 @ y) / x0_sq if x0_sq > 0 else 0.0
+        Xt = Xr - np.outer(x0, self.a)
+        yt = y - x0 * self.a_y
+
+        self.s, self.V = np.linalg.eigh(Xt.T @ Xt / N)
+        self.c = self.V.T @ (Xt.T @ yt / N)
+
+    def weights(self, lambdas):
+        """
+        :param lambdas: Sequence of L values of reg_lambda.
+        :return: An array of shape (L, D) with the weights for each value.
+        """
+        lambdas = np.asarray(lambdas, dtype=float).reshape(-1, 1)
+        w_rest = (self.c / (self.s + lambdas)) @ self.V.T
+        w0 = self.a_y - w_rest @ self.a
+        return np.column_stack([w0, w_rest])
+
+    def loo_mse(self, X, y, lambdas):
+        """
+        :param X: The data this decomposition was computed from.
+        :param y: The targets this decomposition was computed from.
+        :param lambdas: Sequence of L values of reg_lambda.
+        :return: An array of shape (L,) with the leave-one-out MSE for each
+            value, using the residuals identity e_i / (1 - h_ii).
+        """
+        N = X.shape[0]
+        # A fit on N-1 samples solves (X^TX + (N-1)*lambda*I) w = X^Ty, which
+        # is the full-data system with reg_lambda scaled by (N-1)/N
+        lambdas = np.asarray(lambdas, dtype=float) * (N - 1) / N
+        residuals = y.reshape(-1, 1) - X @ self.weights(lambdas).T
+
+        # Hat matrix diagonal: projection on x0 plus the ridge part
+        x0 = X[:, 0]
+        x0_sq = x0 @ x0
+        h = (x0 ** 2 / x0_sq if x0_sq > 0 else np.zeros(N)).reshape(-1, 1)
+        P = (X[:, 1:] - np.outer(x0, self.a)) @ self.V
+        h = h + (P ** 2) @ (1.0 / (N * (self.s.reshape(-1, 1) + lambdas)))
+
+        return np.mean((residuals / (1 - h)) ** 2, axis=0)
+
+
 def fit_predict_dataframe(
     model, df: DataFrame, target_name: str, feature_names: List[str] = None,
 ):
@@ -92,6 +284,15 @@ def fit_predict_dataframe(
 
 
 class BiasTrickTransformer(BaseEstimator, TransformerMixin):
+    def __init__(self, reuse_buffer=False):
+        """
+        :param reuse_buffer: Whether to write the output into a persistent
+        buffer whose first column is already 1, reused across transform()
+        calls with inputs of the same shape and dtype. Each call then
+        overwrites the array returned by the previous one.
+        """
+        self.reuse_buffer = reuse_buffer
+
     def fit(self, X, y=None):
         return self
 
@@ -103,6 +304,17 @@ class BiasTrickTransformer(BaseEstimator, TransformerMixin):
         """
         X = check_array(X, ensure_2d=True)
 
+        if self.reuse_buffer:
+            shape = (X.shape[0], X.shape[1] + 1)
+            dtype = np.result_type(np.float64, X.dtype)
+            buffer = getattr(self, "_buffer", None)
+            if buffer is None or buffer.shape != shape or buffer.dtype != dtype:
+                buffer = np.empty(shape, dtype=dtype)
+                buffer[:, 0] = 1
+                self._buffer = buffer
+            buffer[:, 1:] = X
+            return buffer
+
         # TODO:
         #  Add bias term to X as the first feature.
         #  See np.hstack().
@@ -116,23 +328,154 @@ class BiasTrickTransformer(BaseEstimator, TransformerMixin):
         return xb
 
 
+class _LRUCache(object):
+    """
+    A dict-like cache which evicts the least recently used entries once it
+    holds more than maxsize of them.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        value = self._entries.get(key)
+        if value is not None:
+            self._entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+
+# Shared by all BostonFeaturesTransformer instances, since e.g. GridSearchCV
+# clones the transformer for every fold and hyperparameter combination.
+_boston_features_cache = _LRUCache(maxsize=32)
+
+
+def _array_fingerprint(X: np.ndarray):
+    """
+    :return: A hashable key identifying the contents of an array.
+    """
+    digest = hashlib.blake2b(np.ascontiguousarray(X).view(np.uint8), digest_size=16)
+    return digest.hexdigest(), X.shape, X.dtype.str
+
+
 class BostonFeaturesTransformer(BaseEstimator, TransformerMixin):
     """
     Generates custom features for the Boston dataset.
     """
 
-    def __init__(self, degree=2):
+    def __init__(
+        self,
+        degree=2,
+        dtype=np.float64,
+        cache=True,
+        feature_map="poly",
+        n_components=100,
+        random_state=None,
+    ):
+        """
+        :param degree: Degree of the polynomial features (or of the polynomial
+            kernel which a random feature map approximates).
+        :param dtype: dtype of the generated features, e.g. np.float32 to halve
+            their memory.
+        :param cache: Whether to memoize the polynomial features generated for
+            each input (by content) and degree, in a bounded LRU cache shared
+            by all instances. Cached feature arrays are read-only.
+        :param feature_map: 'poly' for exact polynomial features, whose number
+            grows combinatorially with the degree, or a random feature map with
+            a fixed number of features: 'tensor_sketch' or 'nystroem' to
+            approximate a polynomial kernel of the given degree, or 'rff'
+            (random Fourier features) to approximate an RBF kernel with
+            gamma = 1 / n_inputs.
+        :param n_components: Number of features a random feature map generates
+            (in addition to a constant bias feature). For 'nystroem', at most
+            the number of samples it's fitted on.
+        :param random_state: Seed for the random feature map.
+        """
         self.degree = degree
 
         # TODO: Your custom initialization, if needed
         # Add any hyperparameters you need and save them as above
         # ====== YOUR CODE: ======
-        self.poly = PolynomialFeatures(degree=degree)
+        self.dtype = dtype
+        self.cache = cache
+        self.feature_map = feature_map
+        self.n_components = n_components
+        self.random_state = random_state
         # ========================
 
     def fit(self, X, y=None):
+        """
+        For polynomial features, computes their layout: every monomial of
+        degree d > 1 is the product of a monomial of degree d-1 (its parent)
+        and one input feature. Columns are in the order PolynomialFeatures
+        uses. For random feature maps, standardizes the inputs and fits the
+        map on them.
+        """
+        X = check_array(X)
+        self.n_features_in_ = X.shape[1]
+        self.degree_ = self.degree
+        n_inputs = X.shape[1] - 1  # CHAS is deleted
+
+        if self.feature_map != "poly":
+            inputs = self._inputs(X)
+            self.mean_ = inputs.mean(axis=0)
+            self.scale_ = inputs.std(axis=0)
+            self.scale_[self.scale_ == 0] = 1
+            inputs = (inputs - self.mean_) / self.scale_
+            self.sampler_ = self._make_sampler(n_inputs).fit(inputs)
+            # Not necessarily n_components, e.g. Nystroem uses at most one
+            # component per sample it's fitted on.
+            self.n_output_features_ = 1 + self.sampler_.transform(inputs[:1]).shape[1]
+            return self
+
+        combinations = list(itertools.chain.from_iterable(
+            itertools.combinations_with_replacement(range(n_inputs), d)
+            for d in range(self.degree_ + 1)
+        ))
+        index = {c: i for i, c in enumerate(combinations)}
+        high_degree = combinations[1 + n_inputs:]
+        self.parents_ = np.array([index[c[:-1]] for c in high_degree], dtype=int)
+        self.factors_ = np.array([1 + c[-1] for c in high_degree], dtype=int)
+        self.n_output_features_ = len(combinations)
         return self
 
+    def _make_sampler(self, n_inputs):
+        kw = dict(n_components=self.n_components, random_state=self.random_state)
+        if self.feature_map == "tensor_sketch":
+            return PolynomialCountSketch(degree=self.degree, **kw)
+        if self.feature_map == "nystroem":
+            return Nystroem(kernel="poly", degree=self.degree, **kw)
+        if self.feature_map == "rff":
+            # Kernel width suited to standardized inputs
+            return RBFSampler(gamma=1.0 / n_inputs, **kw)
+        raise ValueError(f"Unknown feature map {self.feature_map}")
+
+    @staticmethod
+    def _inputs(X, out=None):
+        """
+        Writes the degree-1 features: the inputs without CHAS, with log applied
+        on CRIM and LSTAT.
+        :param out: Matrix of shape (n_samples, n_features_-1) to write into.
+        """
+        inputs = [i for i in range(X.shape[1]) if i != 3]  # delete CHAS
+        if out is None:
+            out = np.empty((X.shape[0], len(inputs)), dtype=X.dtype)
+        for j, i in enumerate(inputs):
+            if i in (0, 12):
+                np.log(X[:, i], out=out[:, j])
+            else:
+                out[:, j] = X[:, i]
+        return out
+
     def transform(self, X):
         """
         Transform features to new features matrix.
@@ -140,6 +483,23 @@ class BostonFeaturesTransformer(BaseEstimator, TransformerMixin):
         :returns: Matrix of shape (n_samples, n_output_features_).
         """
         X = check_array(X)
+        check_is_fitted(self, "n_output_features_")
+
+        if self.feature_map != "poly":
+            inputs = (self._inputs(X) - self.mean_) / self.scale_
+            X_transformed = np.empty((X.shape[0], self.n_output_features_), dtype=self.dtype)
+            X_transformed[:, 0] = 1
+            X_transformed[:, 1:] = self.sampler_.transform(inputs)
+            return X_transformed
+
+        key = None
+        if self.cache:
+            # The layout computed by fit() determines the features, so the
+            # fitted degree (not the current parameter) is part of the key.
+            key = (_array_fingerprint(X), self.degree_, np.dtype(self.dtype).str)
+            X_transformed = _boston_features_cache.get(key)
+            if X_transformed is not None:
+                return X_transformed
 
         # TODO:
         #  Transform the features of X into new features in X_transformed
@@ -149,23 +509,37 @@ class BostonFeaturesTransformer(BaseEstimator, TransformerMixin):
 
         X_transformed = None
         # ====== YOUR CODE: ======
-        X_transformed = np.copy(X)
-        X_transformed[:, 0] = np.log(X_transformed[:, 0]) #apply log on CRIM
-        X_transformed[:, 12] = np.log(X_transformed[:, 12])#apply log on LSTAT
-        X_transformed = np.delete (X_transformed, 3, axis=1)  # delete CHAS
-        X_transformed = self.poly.fit_transform(X_transformed)
+        # Column-major, so that every feature is written contiguously
+        X_transformed = np.empty((X.shape[0], self.n_output_features_), dtype=self.dtype, order="F")
+        X_transformed[:, 0] = 1
+        n_inputs = X.shape[1] - 1
+        self._inputs(X, out=X_transformed[:, 1:1 + n_inputs])
+        # Higher degrees, each from a lower degree column and an input
+        for j, (parent, factor) in enumerate(zip(self.parents_, self.factors_), start=1 + n_inputs):
+            np.multiply(X_transformed[:, parent], X_transformed[:, factor], out=X_transformed[:, j])
         # ========================)
+
+        if key is not None:
+            X_transformed.flags.writeable = False
+            _boston_features_cache.put(key, X_transformed)
         return X_transformed
 
 
-def top_correlated_features(df: DataFrame, target_feature, n=5):
+def top_correlated_features(
+    df: DataFrame, target_feature, n=5, columns: List[str] = None, chunk_size=1024,
+):
     """
     Returns the names of features most strongly correlated (correlation is
     close to 1 or -1) with a target feature. Correlation is Pearson's-r sense.
 
-    :param df: A pandas dataframe.
+    :param df: A pandas dataframe. Can also be a 2D array (e.g. a memmap) of
+        shape (n_samples, n_columns), in which case columns must be given.
     :param target_feature: The name of the target feature.
     :param n: Number of top features to return.
+    :param columns: Names of the columns of df, if it's an array.
+    :param chunk_size: Number of columns to process at a time, which bounds
+        the extra memory to n_samples * chunk_size values. The data is assumed
+        to have no missing values.
     :return: A tuple of
         - top_n_features: Sequence of the top feature names
         - top_n_corr: Sequence of correlation coefficients of above features
@@ -176,12 +550,48 @@ def top_correlated_features(df: DataFrame, target_feature, n=5):
     # TODO: Calculate correlations with target and sort features by it
 
     # ====== YOUR CODE: ======
-    relevant_features_df = df.drop(target_feature, axis=1, inplace=False)
-    correlations = relevant_features_df.corrwith(df[target_feature], method='pearson')
-    correlations.sort_values(ascending=False, inplace=True, key=np.abs)
-
-    top_n_features = correlations.index[:n].to_numpy()
-    top_n_corr = correlations.iloc[:n].to_numpy()
+    if isinstance(df, DataFrame):
+        columns = df.columns
+
+        def column_chunk(start, end):
+            return df.iloc[:, start:end].to_numpy(dtype=np.float64, copy=True)
+    else:
+        if columns is None:
+            raise ValueError("Column names are required for an array")
+
+        def column_chunk(start, end):
+            return np.array(df[:, start:end], dtype=np.float64)
+
+    columns = np.asarray(columns)
+    target_idx = np.flatnonzero(columns == target_feature)
+    if len(target_idx) == 0:
+        raise KeyError(target_feature)
+    target_idx = int(target_idx[0])
+
+    target = column_chunk(target_idx, target_idx + 1)[:, 0]
+    target = target - target.mean()
+    target /= np.linalg.norm(target)
+
+    # Pearson's r of each column with the target, as a matrix-vector product
+    # of the standardized columns with the standardized target
+    correlations = np.empty(len(columns))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        for start in range(0, len(columns), chunk_size):
+            chunk = column_chunk(start, start + chunk_size)
+            chunk -= chunk.mean(axis=0)
+            chunk /= np.linalg.norm(chunk, axis=0)
+            correlations[start:start + chunk.shape[1]] = target @ chunk
+
+    # Rank by absolute correlation, constant columns (NaN) last. The target
+    # ranks below them, so it's never among the n <= len(columns)-1 selected.
+    scores = np.nan_to_num(np.abs(correlations), nan=-1.0)
+    scores[target_idx] = -np.inf
+    n = min(n, len(columns) - 1)
+    top_n_idx = np.argpartition(-scores, n - 1)[:n] if n > 0 else np.array([], dtype=int)
+    top_n_idx = top_n_idx[np.argsort(-scores[top_n_idx], kind="stable")]
+
+    top_n_features = columns[top_n_idx]
+    top_n_corr = correlations[top_n_idx]
     # ========================
 
     return top_n_features, top_n_corr
@@ -220,8 +630,73 @@ def r2_score(y: np.ndarray, y_pred: np.ndarray):
     return r2
 
 
+class RegressionScoreAccumulator(object):
+    """
+    Accumulates the sufficient statistics of mse_score() and r2_score() over
+    chunks of targets and predictions, so they can be computed without having
+    all of them in memory. Accumulators updated on different chunks (e.g. by
+    different workers) can be merged.
+    The targets' sum of squared deviations is kept in the numerically stable
+    (count, mean, M2) form rather than as a raw sum of squares.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.rss = 0.0
+
+    def update(self, y: np.ndarray, y_pred: np.ndarray):
+        """
+        Adds a chunk of targets and predictions.
+        :param y: Ground truth labels, shape (N,)
+        :param y_pred: Predictions, shape (N,)
+        :return: self
+        """
+        y = np.asarray(y, dtype=np.float64).reshape(-1)
+        y_pred = np.asarray(y_pred, dtype=np.float64).reshape(-1)
+        if len(y) == 0:
+            return self
+
+        chunk = RegressionScoreAccumulator()
+        chunk.count = len(y)
+        chunk.mean = np.mean(y)
+        chunk.m2 = np.sum(np.square(y - chunk.mean))
+        chunk.rss = np.sum(np.square(y - y_pred))
+        return self.merge(chunk)
+
+    def merge(self, other: "RegressionScoreAccumulator"):
+        """
+        Adds the statistics of another accumulator to this one.
+        :param other: The accumulator to merge.
+        :return: self
+        """
+        if other.count == 0:
+            return self
+
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta ** 2 * self.count * other.count / count
+        self.rss += other.rss
+        self.count = count
+        return self
+
+    def mse(self):
+        """
+        :return: MSE score of all accumulated chunks.
+        """
+        return self.rss / self.count
+
+    def r2(self):
+        """
+        :return: R^2 score of all accumulated chunks.
+        """
+        return 1 - self.rss / self.m2
+
+
 def cv_best_hyperparams(
-    model: BaseEstimator, X, y, k_folds, degree_range, lambda_range
+    model: BaseEstimator, X, y, k_folds, degree_range, lambda_range, reg_path=False,
 ):
     """
     Cross-validate to find best hyperparameters with k-fold CV.
@@ -230,10 +705,19 @@ def cv_best_hyperparams(
     :param model: sklearn model.
     :param lambda_range: Range of values for the regularization hyperparam.
     :param degree_range: Range of values for the degree hyperparam.
-    :param k_folds: Number of folds for splitting the training data into.
+    :param k_folds: Number of folds for splitting the training data into, or
+        'loo' for leave-one-out CV.
+    :param reg_path: Whether to use a fast path for a Pipeline ending with a
+        LinearRegressor: the features are computed once per (fold, degree)
+        and the solutions for all lambdas come from a single decomposition.
+        With k_folds='loo' the exact LOO error is computed in closed form from
+        a single fit per degree, which assumes the feature transformers are
+        stateless (e.g. don't learn scaling statistics).
     :return: A dict containing the best model parameters,
         with some of the keys as returned by model.get_params()
     """
+    if reg_path:
+        return _cv_reg_path(model, X, y, k_folds, degree_range, lambda_range)
 
     # TODO: Do K-fold cross validation to find the best hyperparameters
     #  Notes:
@@ -249,8 +733,48 @@ def cv_best_hyperparams(
 
     # ====== YOUR CODE: ======
     params_dict = {'linearregressor__reg_lambda': lambda_range, 'bostonfeaturestransformer__degree': degree_range}
-    grid_search = sklearn.model_selection.GridSearchCV(model, params_dict, cv=k_folds, scoring='neg_mean_squared_error')
+    cv = sklearn.model_selection.LeaveOneOut() if k_folds == "loo" else k_folds
+    grid_search = sklearn.model_selection.GridSearchCV(model, params_dict, cv=cv, scoring='neg_mean_squared_error')
     grid_search.fit(X, y)
     # ========================
     best_params = grid_search.best_params_
     return best_params
+
+
+def _cv_reg_path(model: Pipeline, X, y, k_folds, degree_range, lambda_range):
+    """
+    K-fold or LOO CV for cv_best_hyperparams() using LinearRegressor.fit_path()
+    and LinearRegressor.loo_score(). The folds and the MSE score are the same
+    GridSearchCV would use.
+    """
+    X, y = check_X_y(X, y)
+    features = Pipeline(model.steps[:-1])
+    regressor_name, regressor = model.steps[-1]
+
+    def transform(degree, X_train, y_train, X_valid=None):
+        fold_features = sklearn.base.clone(features)
+        fold_features.set_params(bostonfeaturestransformer__degree=degree)
+        for _, transformer in fold_features.steps:
+            X_train = transformer.fit_transform(X_train, y_train)
+            if X_valid is not None:
+                X_valid = transformer.transform(X_valid)
+        return X_train, X_valid
+
+    mse = np.zeros((len(degree_range), len(lambda_range)))
+    if k_folds == "loo":
+        for i, degree in enumerate(degree_range):
+            X_features, _ = transform(degree, X, y)
+            mse[i] = regressor.loo_score(X_features, y, lambda_range)
+    else:
+        for train_idx, valid_idx in KFold(n_splits=k_folds).split(X):
+            for i, degree in enumerate(degree_range):
+                X_train, X_valid = transform(degree, X[train_idx], y[train_idx], X[valid_idx])
+                W = regressor.fit_path(X_train, y[train_idx], lambda_range)
+                residuals = X_valid @ W.T - y[valid_idx].reshape(-1, 1)
+                mse[i] += np.mean(residuals ** 2, axis=0)
+
+    i, j = np.unravel_index(np.argmin(mse), mse.shape)
+    return {
+        f"{regressor_name}__reg_lambda": lambda_range[j],
+        "bostonfeaturestransformer__degree": degree_range[i],
+    }
@@ -22,6 +22,15 @@ class ClassifierLoss(abc.ABC):
         """
         pass
 
+    def loss_and_grad(self, *args, **kw):
+        """
+        Calculates the loss and its gradient w.r.t. model parameters together.
+        Subclasses may override this with a fused implementation.
+        :return: A tuple (loss, grad).
+        """
+        loss = self.loss(*args, **kw)
+        return loss, self.grad()
+
 
 class SVMHingeLoss(ClassifierLoss):
     def __init__(self, delta=1.0):
@@ -32,14 +41,18 @@ class SVMHingeLoss(ClassifierLoss):
         """
         Calculates the Hinge-loss for a batch of samples.
 
-        :param x: Batch of samples in a Tensor of shape (N, D).
+        :param x: Batch of samples in a Tensor of shape (N, D). Can be a
+            sparse CSR tensor.
         :param y: Ground-truth labels for these samples: (N,)
         :param x_scores: The predicted class score for each sample: (N, C).
+            Can also be (K, N, C) for the scores of K models on the same
+            samples, in which case a loss is computed for each model.
         :param y_predicted: The predicted class label for each sample: (N,).
-        :return: The classification loss as a Tensor of shape (1,).
+        :return: The classification loss as a Tensor of shape (1,), or (K,)
+            for K models.
         """
 
-        assert x_scores.shape[0] == y.shape[0]
+        assert x_scores.shape[-2] == y.shape[0]
         assert y.dim() == 1
 
         # TODO: Implement SVM loss calculation based on the hinge-loss formula.
@@ -52,18 +65,22 @@ class SVMHingeLoss(ClassifierLoss):
 
         loss = None
         # ====== YOUR CODE: ======
-        correct_classes_scores = torch.gather(x_scores, 1, y.view(-1, 1))
+        # index of the correct class, broadcast over any leading model dimension
+        y_idx = y.view(-1, 1).expand(*x_scores.shape[:-1], 1)
+        correct_classes_scores = torch.gather(x_scores, -1, y_idx)
         M = self.delta + (x_scores - correct_classes_scores)
         # zero out negative losses (like applying max)
         M = torch.clamp(M, min=0.0)
         #subtract delta from each row to ensure that the true class score does not contribute to the penalty
-        loss_per_sample = torch.sum(M, 1)-self.delta
-        loss = torch.mean(loss_per_sample)
+        loss_per_sample = torch.sum(M, -1)-self.delta
+        loss = torch.mean(loss_per_sample, -1)
         # ========================
 
         # TODO: Save what you need for gradient calculation in self.grad_ctx
         # ====== YOUR CODE: ======
-        self.grad_ctx["M"] = M
+        # Only whether each margin is active is needed, so keep a bool mask
+        # rather than the float matrix M
+        self.grad_ctx["mask"] = M > 0
         self.grad_ctx["x"] = x
         self.grad_ctx["y"] = y
         # ========================
@@ -73,7 +90,7 @@ class SVMHingeLoss(ClassifierLoss):
     def grad(self):
         """
         Calculates the gradient of the Hinge-loss w.r.t. parameters.
-        :return: The gradient, of shape (D, C).
+        :return: The gradient, of shape (D, C), or (K, D, C) for K models.
         """
         # TODO:
         #  Implement SVM loss gradient calculation
@@ -82,14 +99,64 @@ class SVMHingeLoss(ClassifierLoss):
 
         grad = None
         # ====== YOUR CODE: ======
-        M = self.grad_ctx["M"]
+        mask = self.grad_ctx["mask"]
         x = self.grad_ctx["x"]
         y = self.grad_ctx["y"]
-        N = x.shape[0]
 
-        G = (M > 0).float()
-        # we want to count number of 1's i each row except of the correct class cell
-        G[torch.arange(N), y] = -1 * (torch.sum(G, dim=1) - G[torch.arange(N), y])
-        grad = x.T @ G / N
+        G = mask.to(x.dtype)
+        grad = self._grad_from_active_margins(x, y, G)
         # ========================
         return grad
+
+    def loss_and_grad(self, x, y, x_scores, y_predicted):
+        """
+        Calculates the Hinge-loss and its gradient w.r.t. parameters in one
+        pass, reusing the margin matrix's memory for the gradient factor.
+        Arguments are the same as for loss(). No autograd graph is recorded.
+        :return: A tuple (loss, grad) of the same loss and gradient as
+            loss() followed by grad() would return.
+        """
+        assert x_scores.shape[-2] == y.shape[0]
+        assert y.dim() == 1
+
+        with torch.no_grad():
+            y_idx = y.view(-1, 1).expand(*x_scores.shape[:-1], 1)
+            M = x_scores - torch.gather(x_scores, -1, y_idx)
+            M.add_(self.delta).clamp_(min=0.0)
+            loss = torch.mean(torch.sum(M, -1) - self.delta, -1)
+
+            # M becomes the 0/1 active-margin matrix, in place
+            G = M.gt_(0).to(x.dtype)
+            grad = self._grad_from_active_margins(x, y, G)
+
+        return loss, grad
+
+    @staticmethod
+    def _grad_from_active_margins(x, y, G):
+        """
+        :param G: A float matrix (N, C) or (K, N, C) which is 1 where the
+            margin is active and 0 elsewhere. It's modified in place.
+        :return: The gradient X^T * G / N.
+        """
+        N = x.shape[0]
+        # we want to count number of 1's i each row except of the correct class cell
+        y_idx = y.view(-1, 1).expand(*G.shape[:-1], 1)
+        G.scatter_(-1, y_idx, -1 * (torch.sum(G, dim=-1, keepdim=True) - G.gather(-1, y_idx)))
+        return transpose_matmul(x, G) / N
+
+
+def transpose_matmul(x, G):
+    """
+    Calculates x^T * G, also for a sparse x, so that time and memory scale
+    with its number of non-zeros.
+    :param x: A dense or sparse CSR tensor of shape (N, D).
+    :param G: A dense tensor of shape (N, C), or (K, N, C).
+    :return: A dense tensor of shape (D, C), or (K, D, C).
+    """
+    if x.layout != torch.sparse_csr:
+        return x.T @ G
+
+    # Sparse matmul only supports 2D operands, so fold K into the columns
+    G_cols = G.movedim(-2, 0)
+    out = torch.sparse.mm(x.t(), G_cols.reshape(x.shape[0], -1))
+    return out.reshape(-1, *G_cols.shape[1:]).movedim(0, -2)
@@ -1,4 +1,6 @@
 import torch
+import torchvision.transforms as tvtf
+from torch.utils.data.dataloader import default_collate
 
 
 class TensorView(object):
@@ -50,17 +52,51 @@ class BiasTrick(object):
     1 to each sample in a given tensor.
     """
 
-    def __call__(self, x: torch.Tensor):
+    def __init__(self, reuse_buffer=False):
+        """
+        :param reuse_buffer: Whether to write the output into a persistent
+        buffer whose first feature is already 1, reused across calls with
+        inputs of the same shape, dtype and device. Each call then overwrites
+        the tensor returned by the previous one, so only use it when the
+        result is consumed before the next call (e.g. per batch in a
+        training loop, not as a per-sample dataset transform).
+        """
+        self.reuse_buffer = reuse_buffer
+        self._buffer = None
+
+    def __call__(self, x: torch.Tensor, out: torch.Tensor = None):
         """
         :param x: A pytorch tensor of shape (D,) or (N1,...Nk, D).
         We assume D is the number of features and the N's are extra
         dimensions. E.g. shape (N,D) for N samples of D features;
         shape (D,) or (1, D) for one sample of D features.
+        :param out: Optional tensor of shape (N1,...Nk, D+1) to write the
+        result into.
         :return: A tensor with D+1 features, where a '1' was prepended to
         each sample's feature dimension.
         """
         assert x.dim() > 0, "Scalars not supported"
 
+        out_shape = (*x.shape[:-1], x.shape[-1] + 1)
+        if out is not None:
+            out[..., 0] = 1
+            out[..., 1:] = x
+            return out
+
+        if self.reuse_buffer:
+            buffer = self._buffer
+            if (
+                buffer is None
+                or buffer.shape != out_shape
+                or buffer.dtype != x.dtype
+                or buffer.device != x.device
+            ):
+                buffer = torch.empty(out_shape, dtype=x.dtype, device=x.device)
+                buffer[..., 0] = 1
+                self._buffer = buffer
+            buffer[..., 1:] = x
+            return buffer
+
         # TODO:
         #  Add a 1 at the beginning of the given tensor's feature dimension.
         #  Hint: See torch.cat().
@@ -71,3 +107,170 @@ class BiasTrick(object):
         # torch.cat((ones_tensor, x), dim=1)
         return torch.cat((ones_tensor, x), dim=-1)
         # ========================
+
+
+class BatchTransform(object):
+    """
+    A transform applied once to a whole collated batch of samples, equivalent
+    to applying a sequence of per-sample transforms to each sample.
+    Created by compile_batch_transform().
+    """
+
+    def __init__(self, stages):
+        """
+        :param stages: A list of callables, each taking a batch tensor and a
+            flag telling whether the stage may modify it in place, and returning
+            the transformed batch and the same flag for the next stage.
+        """
+        self.stages = stages
+
+    def __call__(self, x: torch.Tensor):
+        """
+        :param x: A batch tensor of shape (N, ...) where (...) is the shape
+            of a single sample. It is never modified.
+        :return: The transformed batch.
+        """
+        owned = False
+        for stage in self.stages:
+            x, owned = stage(x, owned)
+        return x
+
+    def collate(self, batch):
+        """
+        A collate_fn for a DataLoader: collates samples into a batch and then
+        transforms the samples tensor (the first element if the samples are
+        tuples, e.g. (sample, label)).
+        """
+        batch = default_collate(batch)
+        if isinstance(batch, (tuple, list)):
+            return type(batch)((self(batch[0]), *batch[1:]))
+        return self(batch)
+
+
+def compile_batch_transform(transform):
+    """
+    Splits a sequence of transforms into a per-sample part and an equivalent
+    batch-level part which runs once per collated batch.
+    Supported batch-level transforms are TensorView, InvertColors, FlipUpDown,
+    BiasTrick and torchvision's Normalize. Consecutive elementwise transforms
+    are fused into a single affine op, and an elementwise op followed by views
+    and BiasTrick writes directly into the output tensor. Only tensors
+    allocated by the batch transform itself are modified in place.
+    :param transform: A torchvision Compose, or a list of transforms.
+    :return: A tuple (sample_transform, batch_transform), where sample_transform
+        is a Compose of the leading transforms which can't run on a batch (e.g.
+        ToTensor) or None if there are none, and batch_transform is a
+        BatchTransform for the rest.
+    """
+    transforms = list(getattr(transform, "transforms", transform))
+
+    # Find the longest suffix of transforms which can run on a batch
+    ops = []
+    while transforms:
+        op = _batch_op(transforms[-1])
+        if op is None:
+            break
+        ops.insert(0, op)
+        transforms.pop()
+
+    # Fuse consecutive affine ops: (x*a1 + b1)*a2 + b2 = x*(a1*a2) + (b1*a2 + b2)
+    fused_ops = []
+    for op in ops:
+        if op[0] == "affine" and fused_ops and fused_ops[-1][0] == "affine":
+            _, a1, b1 = fused_ops.pop()
+            _, a2, b2 = op
+            op = ("affine", a1 * a2, b1 * a2 + b2)
+        fused_ops.append(op)
+
+    stages = []
+    while fused_ops:
+        op = fused_ops.pop(0)
+        if op[0] == "affine":
+            n_views = 0
+            while n_views < len(fused_ops) and fused_ops[n_views][0] == "view":
+                n_views += 1
+            if n_views < len(fused_ops) and fused_ops[n_views][0] == "bias":
+                view_dims = [view_op[1] for view_op in fused_ops[:n_views]]
+                stages.append(_affine_bias_stage(op[1], op[2], view_dims))
+                del fused_ops[: n_views + 1]
+                continue
+        stages.append(_STAGE_FACTORIES[op[0]](*op[1:]))
+
+    sample_transform = tvtf.Compose(transforms) if transforms else None
+    return sample_transform, BatchTransform(stages)
+
+
+def _batch_op(transform):
+    """
+    :return: A description of the batch-level op equivalent to a per-sample
+        transform, or None if it has none.
+    """
+    if isinstance(transform, TensorView):
+        return ("view", transform.view_dims)
+    if isinstance(transform, InvertColors):
+        return ("affine", torch.tensor(-1.0), torch.tensor(1.0))
+    if isinstance(transform, FlipUpDown):
+        return ("flip",)
+    if isinstance(transform, BiasTrick):
+        return ("bias",)
+    if isinstance(transform, tvtf.Normalize):
+        mean = torch.as_tensor(transform.mean, dtype=torch.float).view(-1, 1, 1)
+        std = torch.as_tensor(transform.std, dtype=torch.float).view(-1, 1, 1)
+        return ("affine", 1.0 / std, -mean / std)
+    return None
+
+
+def _affine_stage(scale, shift):
+    def stage(x, owned):
+        scale_, shift_ = scale.to(x), shift.to(x)
+        if owned:
+            return x.mul_(scale_).add_(shift_), True
+        return torch.addcmul(shift_, x, scale_), True
+
+    return stage
+
+
+def _view_stage(view_dims):
+    def stage(x, owned):
+        return x.view(x.shape[0], *view_dims), owned
+
+    return stage
+
+
+def _flip_stage():
+    def stage(x, owned):
+        # Dim 1 of a sample is dim 2 of the batch
+        return torch.flip(x, [2]), True
+
+    return stage
+
+
+def _bias_stage():
+    def stage(x, owned):
+        out = torch.empty((*x.shape[:-1], x.shape[-1] + 1), dtype=x.dtype, device=x.device)
+        out[..., 0] = 1
+        out[..., 1:] = x
+        return out, True
+
+    return stage
+
+
+def _affine_bias_stage(scale, shift, view_dims):
+    def stage(x, owned):
+        # Views of the input are free, and give the shape after the views
+        y = x
+        for dims in view_dims:
+            y = y.view(y.shape[0], *dims)
+        out = torch.empty((*y.shape[:-1], y.shape[-1] + 1), dtype=x.dtype, device=x.device)
+        out[..., 0] = 1
+        # The features part of the output, viewed with the input's shape
+        out_features = out[..., 1:].view(x.shape)
+        torch.addcmul(shift.to(x), x, scale.to(x), out=out_features)
+        return out, True
+
+    return stage
+
+
+_STAGE_FACTORIES = dict(
+    affine=_affine_stage, view=_view_stage, flip=_flip_stage, bias=_bias_stage,
+)
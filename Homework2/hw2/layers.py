@@ -2,6 +2,32 @@ import abc
 import torch
 
 
+class Workspace(object):
+    """
+    A pool of preallocated buffers which layers reuse across calls instead of
+    allocating new tensors. Buffers are allocated once per name, shape, dtype
+    and device, so e.g. a smaller last batch gets its own set.
+    """
+
+    def __init__(self):
+        self.buffers = {}
+
+    def get(self, name, shape, dtype, device):
+        """
+        :return: The buffer with the given name and properties, allocated
+        (uninitialized) on first use.
+        """
+        key = (name, tuple(shape), dtype, device)
+        buffer = self.buffers.get(key)
+        if buffer is None:
+            buffer = torch.empty(shape, dtype=dtype, device=device)
+            self.buffers[key] = buffer
+        return buffer
+
+    def clear(self):
+        self.buffers.clear()
+
+
 class Layer(abc.ABC):
     """
     A Layer is some computation element in a network architecture which
@@ -12,6 +38,7 @@ class Layer(abc.ABC):
         # Store intermediate values needed to compute gradients in this hash
         self.grad_cache = {}
         self.training_mode = True
+        self.workspace = None
 
     def __call__(self, *args, **kwargs):
         return self.forward(*args, **kwargs)
@@ -57,6 +84,33 @@ class Layer(abc.ABC):
         """
         self.training_mode = training_mode
 
+    def use_workspace(self, enabled=True):
+        """
+        Enables or disables a workspace for this layer. With a workspace,
+        outputs, cached values and gradients are written in-place into buffers
+        which are reused by subsequent calls, so a returned tensor is only
+        valid until the next forward (or backward) call. This is incompatible
+        with autograd on the inputs.
+        :param enabled: True: allocate a workspace. False: release it.
+        """
+        self.workspace = Workspace() if enabled else None
+
+    def _buffer(self, name, like, shape=None, dtype=None):
+        """
+        :return: A workspace buffer shaped like the given tensor (or with the
+        given shape and dtype), or None if this layer has no workspace. Meant
+        to be passed as the out= argument of torch functions, which then
+        allocate as usual if it's None.
+        """
+        if self.workspace is None:
+            return None
+        return self.workspace.get(
+            name,
+            like.shape if shape is None else shape,
+            like.dtype if dtype is None else dtype,
+            like.device,
+        )
+
     def __repr__(self):
         return self.__class__.__name__
 
@@ -82,10 +136,15 @@ class LeakyReLU(Layer):
 
         # TODO: Implement the LeakyReLU operation.
         # ====== YOUR CODE: ======
-        out = torch.where(x <= 0, self.alpha*x, x)
+        # Only the sign of x is needed for the gradient, so a bool mask is
+        # cached instead of x itself.
+        positive = torch.gt(x, 0, out=self._buffer("positive", x, dtype=torch.bool))
+        buf = self._buffer("out", x)
+        out = torch.mul(x, self.alpha, out=buf)
+        out = torch.where(positive, x, out, out=buf)
         # ========================
 
-        self.grad_cache["x"] = x
+        self.grad_cache["positive"] = positive
         return out
 
     def backward(self, dout):
@@ -93,13 +152,14 @@ class LeakyReLU(Layer):
         :param dout: Gradient with respect to layer output, shape (N, *).
         :return: Gradient with respect to layer input, shape (N, *)
         """
-        x = self.grad_cache["x"]
+        positive = self.grad_cache["positive"]
 
         # TODO: Implement gradient w.r.t. the input x
         # ====== YOUR CODE: ======
         # dout * gradient of max(alpha*x,x), that is, dout * alpha, where x <= 0 else dout.
-        # x that we saved in the cache in the forward pass
-        dx = dout.clone() # dout is a matrix of N functions, each function is vectoric f(x1, ....xm)
+        # the sign of x that we saved in the cache in the forward pass
+        buf = self._buffer("dx", dout)
+        dx = torch.mul(dout, self.alpha, out=buf) # dout is a matrix of N functions, each function is vectoric f(x1, ....xm)
         """ Since our x is also a matrix shape (N,m) where each row is a "sample", gradient of L which is a scalar function
          w.r.t each sample should b size *, and overall we should plot also one matrix size(N,m) where each row is 
          gradient of L w.r.t the sample.
@@ -112,7 +172,7 @@ class LeakyReLU(Layer):
          in 1d. The derivative of leakyRelU is - alpha if the input < 0 else 1. so its enough just to take the matrix
          of dout and         
          """
-        dx[x <= 0] *= self.alpha
+        dx = torch.where(positive, dout, dx, out=buf)
         # ========================
         return dx
 
@@ -156,7 +216,11 @@ class Sigmoid(Layer):
         #  Save whatever you need into grad_cache.
         # ====== YOUR CODE: ======
 
-        out =  1 / (1 + torch.exp(-x))
+        buf = self._buffer("out", x)
+        out = torch.neg(x, out=buf)
+        out = torch.exp(out, out=buf)
+        out = torch.add(out, 1, out=buf)
+        out = torch.reciprocal(out, out=buf)
         self.grad_cache["sig_out"] = out
         # ========================
 
@@ -171,7 +235,11 @@ class Sigmoid(Layer):
         # TODO: Implement gradient w.r.t. the input x
         # ====== YOUR CODE: ======
         sig_out = self.grad_cache["sig_out"]
-        dx = dout * sig_out * ( 1 - sig_out)
+        # s * (1 - s) = s - s^2
+        buf = self._buffer("dx", dout)
+        dx = torch.mul(sig_out, sig_out, out=buf)
+        dx = torch.sub(sig_out, dx, out=buf)
+        dx = torch.mul(dx, dout, out=buf)
         # ========================
         return dx
 
@@ -198,8 +266,7 @@ class TanH(Layer):
         # TODO: Implement the tanh function.
         #  Save whatever you need into grad_cache.
         # ====== YOUR CODE: ======
-        out = (torch.exp(x) - torch.exp(-x)) / (torch.exp(x) + torch.exp(-x))
-        #out = torch.tanh(x)
+        out = torch.tanh(x, out=self._buffer("out", x))
         self.grad_cache["tanh_out"] = out
         # ========================
 
@@ -214,7 +281,11 @@ class TanH(Layer):
         # TODO: Implement gradient w.r.t. the input x
         # ====== YOUR CODE: ======
         # the derivative is 1-tanh^2
-        dx = dout * (1 - (self.grad_cache["tanh_out"] ** 2))
+        tanh_out = self.grad_cache["tanh_out"]
+        buf = self._buffer("dx", dout)
+        dx = torch.mul(tanh_out, tanh_out, out=buf)
+        dx = torch.sub(1, dx, out=buf)
+        dx = torch.mul(dx, dout, out=buf)
         # ========================
 
         return dx
@@ -264,7 +335,12 @@ class Linear(Layer):
         # TODO: Compute the affine transform
         # ====== YOUR CODE: ======
         # out = x @ self.w.T + self.b
-        out = torch.matmul(x, self.w.transpose(0, 1)) + self.b
+        out = torch.addmm(
+            self.b,
+            x,
+            self.w.transpose(0, 1),
+            out=self._buffer("out", x, shape=(x.shape[0], self.out_features)),
+        )
         # ========================
 
         self.grad_cache["x"] = x
@@ -283,10 +359,10 @@ class Linear(Layer):
         #   - db, the gradient of the loss with respect to b
         #  Note: You should ACCUMULATE gradients in dw and db.
         # ====== YOUR CODE: ======
-        dx = torch.matmul(dout, self.w)
-        self.dw += torch.matmul(dout.transpose(0, 1), x)
+        dx = torch.matmul(dout, self.w, out=self._buffer("dx", x))
+        self.dw.addmm_(dout.transpose(0, 1), x)
         # dl/db = I * dout
-        self.db += torch.sum(dout, dim=0)
+        self.db += torch.sum(dout, dim=0, out=self._buffer("db", self.db))
         # ========================
 
         return dx
@@ -310,7 +386,8 @@ class CrossEntropyLoss(Layer):
 
         :param x: Tensor of shape (N,D) where N is the batch
             dimension, and D is the number of features. Should contain class
-            scores, NOT PROBABILITIES.
+            scores, NOT PROBABILITIES. Half precision (float16/bfloat16)
+            scores are accumulated in float32.
         :param y: Tensor of shape (N,) containing the ground truth label of
             each sample.
         :return: Cross entropy loss, as if we computed the softmax of the
@@ -319,23 +396,34 @@ class CrossEntropyLoss(Layer):
         """
 
         N = x.shape[0]
+        in_dtype = x.dtype
+
+        # Half precision scores are accumulated in float32
+        acc_dtype = torch.promote_types(in_dtype, torch.float32)
+        buf = self._buffer("probs", x, dtype=acc_dtype)
+        x = x.to(acc_dtype) if buf is None else buf.copy_(x)
 
         # Shift input for numerical stability
-        xmax, _ = torch.max(x, dim=1, keepdim=True)
-        x = x - xmax
+        xmax = torch.amax(x, dim=1, keepdim=True, out=self._buffer("xmax", x, shape=(N, 1)))
+        x = torch.sub(x, xmax, out=buf)
 
         # TODO: Compute the cross entropy loss using the last formula from the
         #  notebook (i.e. directly using the class scores).
         # ====== YOUR CODE: ======
-        log_sum_exp = torch.log(torch.sum(torch.exp(x), dim=1))
         # y provides the column indices - the correct class for each sample
-        x_y = x[torch.arange(N), y]
+        x_y = torch.gather(x, 1, y.unsqueeze(1), out=self._buffer("x_y", x, shape=(N, 1)))
+        # The only exp over the scores: its row sums give the log-sum-exp, and
+        # normalized in-place it is the softmax needed by the backward pass.
+        probs = torch.exp(x, out=buf)
+        sum_exp = torch.sum(probs, dim=1, keepdim=True, out=self._buffer("sum_exp", x, shape=(N, 1)))
+        probs = torch.div(probs, sum_exp, out=buf)
         # L_s, a scalar.
-        loss = (-x_y + log_sum_exp).mean()
+        loss = (torch.log(sum_exp) - x_y).mean()
         # ========================
 
-        self.grad_cache["x"] = x
+        self.grad_cache["probs"] = probs
         self.grad_cache["y"] = y
+        self.grad_cache["dtype"] = in_dtype
         return loss
 
     def backward(self, dout=1.0):
@@ -344,9 +432,9 @@ class CrossEntropyLoss(Layer):
             defaults to 1 since the output of forward is scalar.
         :return: Gradient with respect to layer input (only x), shape (N,D)
         """
-        x = self.grad_cache["x"]
+        probs = self.grad_cache["probs"]
         y = self.grad_cache["y"]
-        N = x.shape[0]
+        N = probs.shape[0]
 
         # TODO: Calculate the gradient w.r.t. the input x.
         # ====== YOUR CODE: ======
@@ -354,11 +442,12 @@ class CrossEntropyLoss(Layer):
         # so instead calculate the gradient of l(y,y^) = -y^T*log(y^) with respect to y^
         # we calculate the gradient of l(y,softmax(x)) = -y^T*log(softmax(x)) with respect to x
 
-        # softmax(z) = e^z /sum(e^z)
-        # softmax_x = torch.exp(x) / torch.sum(torch.exp(x), dim=1, keepdim=True)
-        dx = torch.exp(x) / torch.sum(torch.exp(x), dim=1, keepdim=True)
+        # softmax(z) = e^z /sum(e^z), cached by the forward pass. The gradient
+        # is computed in-place on it, so backward can be called once per forward.
+        dx = probs
         dx[torch.arange(N), y] -= 1
         dx *= dout / N
+        dx = dx.to(self.grad_cache["dtype"])
         # ========================
 
         return dx
@@ -384,15 +473,19 @@ class Dropout(Layer):
         #  differently a according to the current training_mode (train/test).
         # ====== YOUR CODE: ======
         if self.training_mode:
-            # prob_tensor is a tensor where each element specifies the probability
-            # of the corresponding element in the output tensor being 1 using Bernoulli distribution
-            prob_tensor = torch.full(x.shape, 1 - self.p)
-            # the dropout mask
-            self.mask = torch.bernoulli(prob_tensor)
-            out = x * self.mask
+            # the dropout mask: each element is kept (True) with probability
+            # 1-p, drawn directly as bool by a single Bernoulli call
+            self.mask = self._buffer("mask", x, dtype=torch.bool)
+            if self.mask is None:
+                self.mask = torch.empty_like(x, dtype=torch.bool)
+            self.mask.bernoulli_(1 - self.p)
+            # inverted dropout: scale the kept activations by 1/(1-p) so that
+            # their expectation is unchanged and test mode needs no scaling
+            buf = self._buffer("out", x)
+            out = torch.mul(x, self.mask, out=buf)
+            out = torch.mul(out, 1 / (1 - self.p), out=buf)
         else:
-            # scale the test-time activations by (1-p)
-            out = x * (1 - self.p)
+            out = x
         # ========================
 
         return out
@@ -401,9 +494,11 @@ class Dropout(Layer):
         # TODO: Implement the dropout backward pass.
         # ====== YOUR CODE: ======
         if self.training_mode:
-            dx = dout * self.mask
+            buf = self._buffer("dx", dout)
+            dx = torch.mul(dout, self.mask, out=buf)
+            dx = torch.mul(dx, 1 / (1 - self.p), out=buf)
         else:
-            dx = dout * (1 - self.p)
+            dx = dout
         # ========================
         return dx
 
@@ -465,6 +560,10 @@ class Sequential(Layer):
         for layer in self.layers:
             layer.train(training_mode)
 
+    def use_workspace(self, enabled=True):
+        for layer in self.layers:
+            layer.use_workspace(enabled)
+
     def __repr__(self):
         res = "Sequential\n"
         for i, layer in enumerate(self.layers):
@@ -547,5 +646,8 @@ class MLP(Layer):
     def train(self, training_mode=True):
         self.sequence.train(training_mode)
 
+    def use_workspace(self, enabled=True):
+        self.sequence.use_workspace(enabled)
+
     def __repr__(self):
         return f"MLP, {self.sequence}"